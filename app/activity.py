@@ -0,0 +1,100 @@
+# app/activity.py
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from tortoise import timezone
+
+from app.cache import TTLCache
+from app.config import ACTIVITY_WINDOW_SECONDS, ACTIVITY_FLUSH_SECONDS
+from app.httpcache import bump_activity_version
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Buffers users' last-login and last-seen times and writes them in bulk.
+
+    A user is noted as seen at most once per ``window`` seconds, and the buffer
+    is written every ``flush_seconds`` with one UPDATE for everyone seen since
+    the last flush (plus one for logins), however many requests they made.
+    """
+
+    def __init__(self, window: float = 300.0, flush_seconds: float = 30.0):
+        self.flush_seconds = flush_seconds
+        # Users noted within the window; entries expire with it
+        self._recent = TTLCache(maxsize=65536, ttl=window)
+        self._seen: Dict[int, datetime] = {}
+        self._logins: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def note_seen(self, user_id: Optional[int]):
+        if user_id is None or self._recent.get(user_id) is not None:
+            return
+        self._recent.set(user_id, True)
+        self._seen[user_id] = timezone.now()
+
+    def note_login(self, user_id: int):
+        now = timezone.now()
+        self._logins[user_id] = now
+        self._seen[user_id] = now
+        self._recent.set(user_id, True)
+
+    async def flush(self):
+        seen, self._seen = self._seen, {}
+        logins, self._logins = self._logins, {}
+        # Users who also logged in get both columns in the login update
+        seen_only = [User(id=user_id, last_seen=at) for user_id, at in seen.items() if user_id not in logins]
+        logged_in = [User(id=user_id, last_login=at, last_seen=seen.get(user_id, at)) for user_id, at in logins.items()]
+        try:
+            if seen_only:
+                await User.bulk_update(seen_only, fields=["last_seen"], batch_size=500)
+            if logged_in:
+                await User.bulk_update(logged_in, fields=["last_login", "last_seen"], batch_size=500)
+        except Exception as e:
+            # Activity is best effort; losing one interval is better than retrying forever
+            logger.error("Could not write activity for %s users: %s", len(seen_only) + len(logged_in), e)
+            return
+        if seen_only or logged_in:
+            self.flushes += 1
+            self.rows_written += len(seen_only) + len(logged_in)
+            # Apart from the data version, so ETags of pages without these times survive
+            bump_activity_version()
+
+    async def _flush_forever(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def start(self):
+        if self._task is None and self.flush_seconds > 0:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_forever())
+
+    # Stop the periodic flush and write what is still buffered
+    async def stop(self):
+        if self._task is not None:
+            # Not cancelled: a flush in progress would lose the entries it took
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_seen": len(self._seen),
+            "pending_logins": len(self._logins),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+activity_tracker = ActivityTracker(ACTIVITY_WINDOW_SECONDS, ACTIVITY_FLUSH_SECONDS)
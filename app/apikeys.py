@@ -0,0 +1,128 @@
+# app/apikeys.py
+
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from tortoise import timezone
+
+from app.cache import TTLCache
+from app.config import API_KEY_HMAC_SECRET, API_KEY_CACHE_TTL, API_KEY_LAST_USED_INTERVAL
+from app.models import ApiKey, User
+from app.shared import shared_state
+
+logger = logging.getLogger(__name__)
+
+# Keys look like "uak_<prefix>.<secret>"; the marker tells them apart from JWTs
+KEY_MARKER = "uak_"
+
+# Key rows by prefix (False for unknown prefixes), so steady traffic skips the lookup
+api_key_cache = TTLCache(maxsize=1024, ttl=API_KEY_CACHE_TTL)
+
+# When each key's last_used_at was last written by this worker
+_last_touched: Dict[int, float] = {}
+
+
+def is_api_key(credentials: str) -> bool:
+    return credentials.startswith(KEY_MARKER)
+
+
+# HMAC-SHA256 rather than bcrypt: the secret is 256 random bits, so a slow hash adds nothing
+def _hash_secret(secret: str) -> str:
+    return hmac.new(API_KEY_HMAC_SECRET.encode(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+def _split_key(raw_key: str) -> Optional[Tuple[str, str]]:
+    prefix, _, secret = raw_key[len(KEY_MARKER):].partition(".")
+    if not prefix or not secret:
+        return None
+    return prefix, secret
+
+
+def _drop_api_key(prefix: str):
+    api_key_cache.invalidate(prefix)
+
+
+shared_state.subscribe("api_key", lambda payload: _drop_api_key(payload["prefix"]))
+
+
+# Create a key for the user; returns the row and the raw key, which is shown only once
+async def issue_api_key(user: User, name: str, scopes: Iterable[str] = (),
+                        expires_days: Optional[int] = None) -> Tuple[ApiKey, str]:
+    prefix = secrets.token_hex(6)
+    secret = secrets.token_urlsafe(32)
+    # By id: the principal may be built from token claims and never loaded from the database
+    key = await ApiKey.create(
+        user_id=user.id,
+        name=name,
+        prefix=prefix,
+        secret_hash=_hash_secret(secret),
+        scopes=" ".join(sorted(set(scopes))),
+        expires_at=timezone.now() + timedelta(days=expires_days) if expires_days else None,
+    )
+    # A miss for this prefix may have been cached while it was free
+    _drop_api_key(prefix)
+    return key, f"{KEY_MARKER}{prefix}.{secret}"
+
+
+async def _get_key(prefix: str) -> Optional[ApiKey]:
+    key = api_key_cache.get(prefix)
+    if key is None:
+        key = await ApiKey.get_or_none(prefix=prefix).select_related("user") or False
+        api_key_cache.set(prefix, key)
+    return key or None
+
+
+# The key's row if the raw key is valid, unexpired and not revoked
+async def authenticate_api_key(raw_key: str) -> Optional[ApiKey]:
+    parts = _split_key(raw_key)
+    if parts is None:
+        return None
+    prefix, secret = parts
+    key = await _get_key(prefix)
+    if key is None or not hmac.compare_digest(key.secret_hash, _hash_secret(secret)):
+        return None
+    now = timezone.now()
+    if key.revoked_at is not None or (key.expires_at is not None and key.expires_at <= now):
+        return None
+    await _touch(key, now)
+    return key
+
+
+# Record use at most once per API_KEY_LAST_USED_INTERVAL per worker, so busy keys don't write on every request
+async def _touch(key: ApiKey, now):
+    last = _last_touched.get(key.id)
+    if last is not None and time.monotonic() - last < API_KEY_LAST_USED_INTERVAL:
+        return
+    _last_touched[key.id] = time.monotonic()
+    key.last_used_at = now
+    await ApiKey.filter(id=key.id).update(last_used_at=now)
+
+
+def key_scopes(key: ApiKey) -> Optional[frozenset]:
+    return frozenset(key.scopes.split()) if key.scopes else None
+
+
+async def revoke_api_key(key: ApiKey):
+    await ApiKey.filter(id=key.id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+    _last_touched.pop(key.id, None)
+    _drop_api_key(key.prefix)
+    shared_state.broadcast("api_key", prefix=key.prefix)
+    logger.info("API key %s revoked for user: %s", key.prefix, key.user_id)
+
+
+# Revoke every live key of a user, e.g. after their password is reset; returns how many
+async def revoke_user_api_keys(user_id: int) -> int:
+    prefixes = await ApiKey.filter(user_id=user_id, revoked_at__isnull=True).values_list("prefix", flat=True)
+    if not prefixes:
+        return 0
+    await ApiKey.filter(user_id=user_id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+    for prefix in prefixes:
+        _drop_api_key(prefix)
+        shared_state.broadcast("api_key", prefix=prefix)
+    logger.info("%s API keys revoked for user: %s", len(prefixes), user_id)
+    return len(prefixes)
@@ -0,0 +1,146 @@
+# app/audit.py
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from tortoise import timezone
+
+from app.config import AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS, AUDIT_QUEUE_SIZE
+from app.logconfig import request_id_var
+from app.models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Collects audit events in memory and inserts them in batches off the request path.
+
+    A batch is written once ``batch_size`` events are waiting or the oldest has
+    waited ``flush_seconds``. When ``queue_size`` events are already queued,
+    ``record`` waits for the writer to catch up instead of growing without bound.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_seconds: float = 1.0, queue_size: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.queue_size = max(0, queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.waits = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def record(self, action: str, actor: Optional[str] = None, target: Optional[str] = None, /, **details):
+        event = AuditEvent(
+            created_at=timezone.now(),
+            actor=actor,
+            action=action,
+            target=target,
+            details=details or None,
+            request_id=None if request_id_var.get() == "-" else request_id_var.get(),
+        )
+        self.recorded += 1
+        if not self.running:
+            # Scripts and tests without a running writer insert straight away
+            await self._write([event])
+            return
+        if self._queue.full():
+            self.waits += 1
+        await self._queue.put(event)
+
+    async def _write(self, events: List[AuditEvent]):
+        try:
+            await AuditEvent.bulk_create(events)
+        except Exception as e:
+            self.failed += len(events)
+            logger.error("Could not write %s audit events: %s", len(events), e)
+            return
+        self.written += len(events)
+        self.batches += 1
+
+    # Wait for the first event, then gather more until the batch is full or due.
+    # A None in the queue asks the writer to stop; it ends the batch it arrives in.
+    async def _next_batch(self) -> List[Optional[AuditEvent]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            events = [event for event in batch if event is not None]
+            if events:
+                await self._write(events)
+            if batch[-1] is None:
+                return
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    # Write everything queued so far, then stop the writer
+    async def stop(self):
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "waits": self.waits,
+        }
+
+
+audit_writer = AuditWriter(AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS, AUDIT_QUEUE_SIZE)
+
+
+# Record that ``actor`` did ``action`` to ``target``; extra keyword arguments are stored as details.
+# The first three are positional-only, so a detail may share their names.
+async def record(action: str, actor: Optional[str] = None, target: Optional[str] = None, /, **details):
+    await audit_writer.record(action, actor, target, **details)
+
+
+# Newest first, keyset-paged on id: pass the last id of a page as ``before_id`` for the next
+async def query_events(actor: Optional[str] = None, target: Optional[str] = None, action: Optional[str] = None,
+                       since: Optional[datetime] = None, until: Optional[datetime] = None,
+                       before_id: Optional[int] = None, limit: int = 50) -> List[AuditEvent]:
+    query = AuditEvent.all()
+    if actor is not None:
+        query = query.filter(actor=actor)
+    if target is not None:
+        query = query.filter(target=target)
+    if action is not None:
+        query = query.filter(action=action)
+    if since is not None:
+        query = query.filter(created_at__gte=since)
+    if until is not None:
+        query = query.filter(created_at__lt=until)
+    if before_id is not None:
+        query = query.filter(id__lt=before_id)
+    return await query.order_by("-id").limit(limit)
@@ -1,11 +1,54 @@
 # app/auth.py
 
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from fastapi import HTTPException
+import jwt
 from passlib.context import CryptContext
-from jose import jwt
 from datetime import datetime, timedelta
-from app.config import SECRET_KEY, ALGORITHM
+from app.cache import TTLCache
+from app.metrics import record_hash_time
+from app.shared import shared_state
+from app.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL,
+    HASH_POOL_KIND,
+    HASH_POOL_WORKERS,
+    HASH_QUEUE_SIZE,
+    PASSWORD_SCHEMES,
+    BCRYPT_ROUNDS,
+    ARGON2_TIME_COST,
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+    PBKDF2_ROUNDS,
+)
+
+# Cost settings per supported scheme, passed to CryptContext as <scheme>__<setting>
+SCHEME_SETTINGS = {
+    "bcrypt": {"rounds": BCRYPT_ROUNDS},
+    "argon2": {"time_cost": ARGON2_TIME_COST, "memory_cost": ARGON2_MEMORY_COST, "parallelism": ARGON2_PARALLELISM},
+    "pbkdf2_sha256": {"rounds": PBKDF2_ROUNDS},
+}
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def build_crypt_context(schemes, settings=None) -> CryptContext:
+    settings = SCHEME_SETTINGS if settings is None else settings
+    options = {
+        f"{scheme}__{name}": value
+        for scheme in schemes
+        for name, value in settings.get(scheme, {}).items()
+    }
+    # Every scheme but the first is deprecated, so needs_update() flags its hashes
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+pwd_context = build_crypt_context(PASSWORD_SCHEMES)
 
 
 def verify_password(plain_password, hashed_password):
@@ -16,8 +59,178 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+# Returns (valid, new_hash); new_hash is set when the stored hash should be upgraded.
+# Hashes from a scheme no longer in PASSWORD_SCHEMES never verify.
+def verify_and_update_password(plain_password, hashed_password):
+    if not pwd_context.identify(hashed_password):
+        return False, None
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# Runs inside the worker so the measured time excludes queueing
+def _timed_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class HashingPool:
+    """Bounded executor for bcrypt work, kept off the event loop.
+
+    At most ``workers`` hashes run at once and up to ``queue_size`` more may
+    wait; anything beyond that is rejected with a 503 straight away.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 1, queue_size: int = 0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hashing pool kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+        self.wait_seconds_total = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(self._get_executor(), _timed_call, func, *args)
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.hash_seconds_total += elapsed
+        self.hash_seconds_max = max(self.hash_seconds_max, elapsed)
+        self.wait_seconds_total += max(0.0, time.perf_counter() - start - elapsed)
+        record_hash_time(elapsed)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "hash_seconds_total": self.hash_seconds_total,
+            "hash_seconds_max": self.hash_seconds_max,
+            "hash_seconds_avg": self.hash_seconds_total / self.completed if self.completed else 0.0,
+            "wait_seconds_total": self.wait_seconds_total,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(HASH_POOL_KIND, HASH_POOL_WORKERS, HASH_QUEUE_SIZE)
+
+
+async def averify_password(plain_password, hashed_password):
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password):
+    return await hashing_pool.run(get_password_hash, password)
+
+
+async def averify_and_update_password(plain_password, hashed_password):
+    return await hashing_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+
+_dummy_hash = None
+
+
+# Spend the same bcrypt work as a real check when there is no user to check against
+async def dummy_verify_password(plain_password):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await aget_password_hash("dummy-password")
+    await averify_password(plain_password, _dummy_hash)
+    return False
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta if expires_delta else datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + (expires_delta if expires_delta is not None else timedelta(minutes=15))
+    # iat keeps sub-second precision so per-user revocation cutoffs are exact
+    to_encode.update({"exp": expire, "iat": time.time()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+# Verified token digests mapped to their decoded claims
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _check_revoked(key: bytes, payload: dict):
+    if (shared_state.is_revoked(f"token:{key.hex()}")
+            or shared_state.is_revoked(f"user:{payload.get('sub')}", payload.get("iat", 0))):
+        raise jwt.InvalidTokenError("Token has been revoked")
+
+
+# Verify and decode an access token; raises jwt.PyJWTError when invalid or revoked
+def decode_access_token(token: str) -> dict:
+    key = _token_digest(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        # Entries never outlive the token, but re-check in case of clock skew
+        if payload.get("exp", float("inf")) > time.time():
+            _check_revoked(key, payload)
+            return payload
+        token_cache.invalidate(key)
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    token_cache.set(key, payload, ttl=expires_in)
+    _check_revoked(key, payload)
+    return payload
+
+
+# Revoke one access token on every worker until it would have expired anyway
+async def revoke_access_token(token: str):
+    try:
+        payload = decode_access_token(token)
+    except jwt.PyJWTError:
+        return
+    await shared_state.revoke(f"token:{_token_digest(token).hex()}", 0.0, payload.get("exp", time.time()))
+
+
+# Revoke every access token issued to the user so far, e.g. after a password change
+async def revoke_user_access_tokens(username: str):
+    now = time.time()
+    await shared_state.revoke(f"user:{username}", now, now + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
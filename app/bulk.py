@@ -0,0 +1,309 @@
+# app/bulk.py
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import sys
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app import auth, models
+from app.config import BULK_BATCH_SIZE
+from app.database import init_db
+from app.memberships import add_memberships
+from app.pagination import fetch_user_page, invalidate_user_count
+from app.shared import shared_state
+from app.stats import invalidate_group_stats
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+EXPORT_FIELDS = ["username", "email", "full_name", "is_active", "registration_date", "groups"]
+# Errors kept in an import report; the failure count is always exact
+MAX_REPORTED_ERRORS = 1000
+
+
+def guess_format(filename: Optional[str]) -> str:
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def _split_groups(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(";")
+    return [name.strip() for name in value if name and name.strip()]
+
+
+# Yield (line number, record or None, error or None) from a text stream
+def iter_records(stream: Iterable[str], fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+    elif fmt == "ndjson":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Expected a JSON object"
+                continue
+            yield line_no, record, None
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, username: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "username": username, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+class UserImporter:
+    """Validates, hashes and inserts users in batches of ``batch_size`` rows."""
+
+    def __init__(self, batch_size: int = BULK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.report = ImportReport()
+        self._group_ids: Dict[str, int] = {}
+
+    async def run(self, records: Iterable[Tuple[int, Optional[dict], Optional[str]]]) -> ImportReport:
+        batch = []
+        for line_no, record, error in records:
+            if error:
+                self.report.error(line_no, None, error)
+                continue
+            batch.append((line_no, record))
+            if len(batch) >= self.batch_size:
+                await self._import_batch(batch)
+                batch = []
+        if batch:
+            await self._import_batch(batch)
+        if self.report.created:
+            invalidate_user_count()
+            invalidate_group_stats()
+        return self.report
+
+    async def _resolve_groups(self, names: Iterable[str]):
+        missing = [name for name in set(names) if name not in self._group_ids]
+        if missing:
+            for group_id, name in await models.Group.filter(name__in=missing).values_list("id", "name"):
+                self._group_ids[name] = group_id
+
+    async def _hash_passwords(self, passwords: List[str]) -> List[str]:
+        # Stay within the pool's worker count so interactive logins still get a slot
+        limit = asyncio.Semaphore(auth.hashing_pool.workers)
+
+        async def hash_one(password):
+            async with limit:
+                return await auth.aget_password_hash(password)
+
+        return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+    async def _import_batch(self, batch: List[Tuple[int, dict]]):
+        rows = []
+        seen_usernames, seen_emails = set(), set()
+        for line_no, record in batch:
+            username = (record.get("username") or "").strip()
+            email = (record.get("email") or "").strip() or None
+            password = record.get("password") or None
+            hashed_password = record.get("hashed_password") or None
+            if not username:
+                self.report.error(line_no, None, "Missing username")
+                continue
+            if not password and not hashed_password:
+                self.report.error(line_no, username, "Missing password or hashed_password")
+                continue
+            if hashed_password and not auth.pwd_context.identify(hashed_password):
+                self.report.error(line_no, username, "Unrecognised password hash")
+                continue
+            username_lower = models.normalize_identifier(username)
+            email_lower = models.normalize_identifier(email)
+            if username_lower in seen_usernames or (email_lower and email_lower in seen_emails):
+                self.report.error(line_no, username, "Duplicate username or email in batch")
+                continue
+            seen_usernames.add(username_lower)
+            if email_lower:
+                seen_emails.add(email_lower)
+            rows.append({
+                "line": line_no,
+                "username": username,
+                "username_lower": username_lower,
+                "email": email,
+                "email_lower": email_lower,
+                "full_name": (record.get("full_name") or "").strip() or None,
+                "password": password,
+                "hashed_password": hashed_password,
+                "groups": _split_groups(record.get("groups")),
+            })
+        if not rows:
+            return
+
+        taken_usernames = set(await models.User.filter(
+            username_lower__in=list(seen_usernames)
+        ).values_list("username_lower", flat=True))
+        taken_emails = set()
+        if seen_emails:
+            taken_emails = set(await models.User.filter(
+                email_lower__in=list(seen_emails)
+            ).values_list("email_lower", flat=True))
+        await self._resolve_groups(name for row in rows for name in row["groups"])
+
+        accepted = []
+        for row in rows:
+            if row["username_lower"] in taken_usernames:
+                self.report.error(row["line"], row["username"], "Username already taken")
+            elif row["email_lower"] and row["email_lower"] in taken_emails:
+                self.report.error(row["line"], row["username"], "Email already registered")
+            elif any(name not in self._group_ids for name in row["groups"]):
+                unknown = ", ".join(name for name in row["groups"] if name not in self._group_ids)
+                self.report.error(row["line"], row["username"], f"Unknown group: {unknown}")
+            else:
+                accepted.append(row)
+        if not accepted:
+            return
+
+        to_hash = [row for row in accepted if not row["hashed_password"]]
+        for row, hashed in zip(to_hash, await self._hash_passwords([row["password"] for row in to_hash])):
+            row["hashed_password"] = hashed
+
+        try:
+            async with in_transaction():
+                await models.User.bulk_create([
+                    models.User(
+                        username=row["username"],
+                        username_lower=row["username_lower"],
+                        email=row["email"],
+                        email_lower=row["email_lower"],
+                        full_name=row["full_name"],
+                        hashed_password=row["hashed_password"],
+                    )
+                    for row in accepted
+                ])
+                user_ids = dict(await models.User.filter(
+                    username__in=[row["username"] for row in accepted]
+                ).values_list("username", "id"))
+                await add_memberships(
+                    (self._group_ids[name], user_ids[row["username"]])
+                    for row in accepted for name in row["groups"]
+                )
+        except Exception as e:
+            logger.error("Bulk import batch failed: %s", e)
+            for row in accepted:
+                self.report.error(row["line"], row["username"], "Batch insert failed")
+            return
+        self.report.created += len(accepted)
+
+
+async def import_users(stream: Iterable[str], fmt: str, batch_size: int = BULK_BATCH_SIZE) -> ImportReport:
+    return await UserImporter(batch_size).run(iter_records(stream, fmt))
+
+
+def _export_record(user: models.User, include_hashes: bool) -> dict:
+    record = {
+        "username": user.username,
+        "email": user.email,
+        "full_name": user.full_name,
+        "is_active": user.is_active,
+        "registration_date": user.registration_date.isoformat() if user.registration_date else None,
+        "groups": sorted(group.name for group in user.groups),
+    }
+    if include_hashes:
+        record["hashed_password"] = user.hashed_password
+    return record
+
+
+# Stream every user one keyset page at a time
+async def export_users(fmt: str, include_hashes: bool = False, batch_size: int = BULK_BATCH_SIZE) -> AsyncIterator[str]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    fields = EXPORT_FIELDS + (["hashed_password"] if include_hashes else [])
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    if fmt == "csv":
+        writer.writeheader()
+    cursor = None
+    while True:
+        page = await fetch_user_page(batch_size, after=cursor)
+        for user in page.users:
+            record = _export_record(user, include_hashes)
+            if fmt == "csv":
+                record["groups"] = ";".join(record["groups"])
+                writer.writerow(record)
+            else:
+                buffer.write(json.dumps(record) + "\n")
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+
+
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.bulk", description="Bulk user import and export")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="Import users from a CSV or NDJSON file")
+    import_cmd.add_argument("path", help="File to import, or - for stdin")
+    import_cmd.add_argument("--format", choices=FORMATS)
+    import_cmd.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    export_cmd = commands.add_parser("export", help="Export users as CSV or NDJSON")
+    export_cmd.add_argument("--format", choices=FORMATS, default="csv")
+    export_cmd.add_argument("--output", default="-", help="Output file, or - for stdout")
+    export_cmd.add_argument("--include-hashes", action="store_true")
+    args = parser.parse_args(argv)
+
+    await init_db()
+    try:
+        if args.command == "import":
+            fmt = args.format or guess_format(args.path)
+            if args.path == "-":
+                report = await import_users(sys.stdin, fmt, args.batch_size)
+            else:
+                with open(args.path, newline="", encoding="utf-8") as stream:
+                    report = await import_users(stream, fmt, args.batch_size)
+            print(json.dumps(report.as_dict(), indent=2))
+        else:
+            out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+            try:
+                async for chunk in export_users(args.format, args.include_hashes):
+                    out.write(chunk)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+    finally:
+        # Tell running workers about the new users before exiting
+        await shared_state.flush()
+        auth.hashing_pool.shutdown()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,135 @@
+# app/compression.py
+
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript")
+
+
+# Preferred encoding the client accepts: "br" when available, then "gzip"
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 16 + MAX_WBITS writes the gzip header and trailer
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    # Compress a chunk and flush it, so streamed responses keep arriving as they are produced
+    def chunk(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Brotli or gzip compression of text and JSON responses.
+
+    Bodies are compressed only from ``minimum_size`` bytes on; the first bytes are
+    held back until that much has arrived, then the rest is compressed chunk by
+    chunk as it is produced. Responses that already have a Content-Encoding are
+    passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        # Body bytes held back until there are enough to be worth compressing
+        pending = b""
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough, pending
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether compression applies
+                start = message
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)
+                if passthrough:
+                    await send(start)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                # Responses from the http middleware arrive in pieces even when they
+                # are small, so the size is judged on what has been collected so far
+                pending += message.get("body", b"")
+                if more_body and len(pending) < self.minimum_size:
+                    return
+                headers = MutableHeaders(raw=start["headers"])
+                if not more_body and len(pending) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": pending})
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                body, pending = pending, b""
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                return
+
+            body = message.get("body", b"")
+            body = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
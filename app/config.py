@@ -7,7 +7,15 @@ load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Rotating refresh tokens let expired access tokens be renewed without a password check
+REFRESH_TOKENS_ENABLED = os.getenv("REFRESH_TOKENS_ENABLED", "true").lower() == "true"
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_TOKEN_REUSE_GRACE_SECONDS", "30"))
+# API keys for machine clients, sent as "Authorization: Bearer <key>"
+API_KEY_HMAC_SECRET = os.getenv("API_KEY_HMAC_SECRET", SECRET_KEY)
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_LAST_USED_INTERVAL = float(os.getenv("API_KEY_LAST_USED_INTERVAL", "60"))
 
 # Feature toggles
 INVITE_CODE_ENABLED = os.getenv("INVITE_CODE_ENABLED", "false").lower() == "true"
@@ -18,3 +26,96 @@ USERS_PER_PAGE = int(os.getenv("USERS_PER_PAGE", "10"))
 DASHBOARD_TEXT = os.getenv("DASHBOARD_TEXT", "This is the admin dashboard.")
 # Database settings
 DB_URL = os.getenv("DB_URL", "sqlite://db.sqlite3")
+# Storage profile: "compat" keeps SQLite's rollback journal, "production" switches to WAL
+DB_PROFILE = os.getenv("DB_PROFILE", "compat")
+_PRODUCTION_DB = DB_PROFILE == "production"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL" if _PRODUCTION_DB else "DELETE")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL" if _PRODUCTION_DB else "FULL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024) if _PRODUCTION_DB else "0"))
+# Connection pool for PostgreSQL
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20" if _PRODUCTION_DB else "5"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Password hashing schemes: the first hashes new passwords, the rest are only
+# accepted for verification and are upgraded on the user's next login
+PASSWORD_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if scheme.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "29000"))
+# Password hashing pool
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")  # "thread" or "process"
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+# Principal cache (authenticated users and their groups)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+# Stateless authorization: sign group memberships into the access token
+TOKEN_GROUP_CLAIMS_ENABLED = os.getenv("TOKEN_GROUP_CLAIMS_ENABLED", "false").lower() == "true"
+TOKEN_VERSION_CACHE_TTL = float(os.getenv("TOKEN_VERSION_CACHE_TTL", "10"))
+# Cache of verified access tokens
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+# Dashboard pagination
+DASHBOARD_PAGINATION = os.getenv("DASHBOARD_PAGINATION", "offset")  # "offset" or "cursor"
+USER_COUNT_MODE = os.getenv("USER_COUNT_MODE", "exact")  # "exact", "cached" or "approximate"
+USER_COUNT_CACHE_TTL = float(os.getenv("USER_COUNT_CACHE_TTL", "30"))
+# Cached group member counts shown on the dashboard
+GROUP_STATS_CACHE_TTL = float(os.getenv("GROUP_STATS_CACHE_TTL", "60"))
+# Bulk user import/export
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+# Login rate limiting and lockouts
+LOGIN_RATE_LIMIT_ENABLED = os.getenv("LOGIN_RATE_LIMIT_ENABLED", "true").lower() == "true"
+LOGIN_RATE_LIMIT_BACKEND = os.getenv("LOGIN_RATE_LIMIT_BACKEND", "memory")  # "memory" or "sqlite"
+LOGIN_RATE_LIMIT_SQLITE_PATH = os.getenv("LOGIN_RATE_LIMIT_SQLITE_PATH", "ratelimit.sqlite3")
+LOGIN_RATE_LIMIT_MAX_KEYS = int(os.getenv("LOGIN_RATE_LIMIT_MAX_KEYS", "100000"))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "10"))
+LOGIN_IDENTIFIER_BURST = float(os.getenv("LOGIN_IDENTIFIER_BURST", "5"))
+LOGIN_IDENTIFIER_PER_MINUTE = float(os.getenv("LOGIN_IDENTIFIER_PER_MINUTE", "5"))
+LOGIN_LOCKOUT_THRESHOLD = int(os.getenv("LOGIN_LOCKOUT_THRESHOLD", "5"))
+LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv("LOGIN_LOCKOUT_BASE_SECONDS", "1"))
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv("LOGIN_LOCKOUT_MAX_SECONDS", "900"))
+# Templates: check files for changes on every render, and where compiled bytecode is cached
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "true").lower() == "true"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")  # defaults to a per-user temp directory
+# Request metrics at /metrics and the slow-request sampler
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))  # 0 disables
+SLOW_REQUEST_PROFILE_RATE = float(os.getenv("SLOW_REQUEST_PROFILE_RATE", "0"))  # fraction of requests run under cProfile
+SLOW_REQUEST_SAMPLES = int(os.getenv("SLOW_REQUEST_SAMPLES", "20"))
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # e.g. "app.user_manager=0.01"
+# Create tables, apply upgrades and the default admin when a worker finds an uninitialised
+# or outdated database; set false to require `python -m app.init` to have run first
+AUTO_INIT = os.getenv("AUTO_INIT", "true").lower() == "true"
+# State shared between workers: token revocations and cache invalidation broadcasts
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")  # "memory", "sqlite" or "redis"
+SHARED_STATE_SQLITE_PATH = os.getenv("SHARED_STATE_SQLITE_PATH", "shared_state.sqlite3")
+SHARED_STATE_REDIS_URL = os.getenv("SHARED_STATE_REDIS_URL", "redis://localhost:6379/0")  # "memory://" for an in-process fake
+SHARED_STATE_POLL_SECONDS = float(os.getenv("SHARED_STATE_POLL_SECONDS", "1"))
+# User search
+SEARCH_MIN_CHARS = int(os.getenv("SEARCH_MIN_CHARS", "2"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "5"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+# Role-based access control
+PERMISSION_CACHE_TTL = float(os.getenv("PERMISSION_CACHE_TTL", "60"))
+# Audit log writer
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+# Last-login and last-seen tracking
+ACTIVITY_WINDOW_SECONDS = float(os.getenv("ACTIVITY_WINDOW_SECONDS", "300"))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "30"))
+# HTTP caching and compression
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
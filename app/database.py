@@ -0,0 +1,74 @@
+# app/database.py
+
+from urllib.parse import parse_qs, urlparse
+
+from tortoise import Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
+
+from app.config import (
+    DB_URL,
+    DB_PROFILE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+)
+
+MODULES = {"models": ["app.models"]}
+
+
+# Tortoise config for DB_URL with the storage profile applied.
+# Options given as DB_URL query parameters take precedence.
+def build_tortoise_config(db_url: str = DB_URL) -> dict:
+    connection = expand_db_url(db_url)
+    credentials = connection["credentials"]
+    engine = connection["engine"]
+    # expand_db_url fills in backend defaults, so only skip what the URL spelled out
+    explicit = parse_qs(urlparse(db_url).query)
+    settings = {}
+    if engine == "tortoise.backends.sqlite":
+        # The sqlite backend runs each of these as a PRAGMA when it connects
+        settings = {
+            "journal_mode": SQLITE_JOURNAL_MODE,
+            "synchronous": SQLITE_SYNCHRONOUS,
+            "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+            "mmap_size": SQLITE_MMAP_SIZE,
+        }
+    elif engine in ("tortoise.backends.asyncpg", "tortoise.backends.psycopg"):
+        settings = {"minsize": DB_POOL_MIN_SIZE, "maxsize": DB_POOL_MAX_SIZE}
+        if engine == "tortoise.backends.asyncpg":
+            settings["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    for key, value in settings.items():
+        if key not in explicit:
+            credentials[key] = value
+    return {
+        "connections": {"default": connection},
+        "apps": {"models": {"models": MODULES["models"], "default_connection": "default"}},
+    }
+
+
+async def init_db():
+    await Tortoise.init(config=build_tortoise_config())
+
+
+# Settings actually in effect on the default connection
+async def db_health() -> dict:
+    conn = Tortoise.get_connection("default")
+    dialect = conn.capabilities.dialect
+    health = {"dialect": dialect, "profile": DB_PROFILE}
+    if dialect == "sqlite":
+        for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+            _, rows = await conn.execute_query(f"PRAGMA {pragma}")
+            health[pragma] = rows[0][0] if rows else None
+    else:
+        await conn.execute_query("SELECT 1")
+        pool = getattr(conn, "_pool", None)
+        health["pool_min_size"] = getattr(conn, "pool_minsize", None)
+        health["pool_max_size"] = getattr(conn, "pool_maxsize", None)
+        if pool is not None and hasattr(pool, "get_size"):
+            health["pool_size"] = pool.get_size()
+            health["pool_idle"] = pool.get_idle_size()
+    return health
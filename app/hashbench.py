@@ -0,0 +1,80 @@
+# app/hashbench.py
+#
+# Measure password hashing throughput per core for one or more cost profiles:
+#
+#   python -m app.hashbench
+#   python -m app.hashbench --profile bcrypt:rounds=10 --profile argon2:time_cost=2,memory_cost=32768 --workers 4
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.auth import SCHEME_SETTINGS, build_crypt_context
+from app.config import PASSWORD_SCHEMES
+
+
+# "scheme" or "scheme:name=value,name=value" -> (scheme, settings)
+def parse_profile(spec: str):
+    scheme, _, options = spec.partition(":")
+    settings = dict(SCHEME_SETTINGS.get(scheme, {}))
+    for option in filter(None, options.split(",")):
+        name, _, value = option.partition("=")
+        settings[name.strip()] = int(value)
+    return scheme, settings
+
+
+def _run(scheme: str, settings: dict, seconds: float) -> tuple:
+    context = build_crypt_context([scheme], {scheme: settings})
+    password = "benchmark-password"
+    hashed = context.hash(password)
+    hashes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        context.verify(password, hashed)
+        hashes += 1
+    return hashes, time.perf_counter() - start
+
+
+def benchmark(spec: str, seconds: float, workers: int) -> dict:
+    scheme, settings = parse_profile(spec)
+    hashes, elapsed = _run(scheme, settings, seconds)
+    result = {
+        "profile": spec,
+        "scheme": scheme,
+        "settings": settings,
+        "ms_per_hash": elapsed / hashes * 1000,
+        "hashes_per_sec_per_core": hashes / elapsed,
+    }
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            runs = list(pool.map(_run, [scheme] * workers, [settings] * workers, [seconds] * workers))
+        result["workers"] = workers
+        result["hashes_per_sec_total"] = sum(count / took for count, took in runs)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.hashbench", description="Password hashing throughput")
+    parser.add_argument("--profile", action="append",
+                        help="scheme[:name=value,...], e.g. bcrypt:rounds=12 (default: the configured schemes)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each measurement")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Also measure this many processes hashing in parallel")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = [benchmark(spec, args.seconds, args.workers) for spec in args.profile or PASSWORD_SCHEMES]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        line = f"{result['profile']:<40} {result['ms_per_hash']:8.1f} ms/hash {result['hashes_per_sec_per_core']:8.1f} hashes/s/core"
+        if "hashes_per_sec_total" in result:
+            line += f" {result['hashes_per_sec_total']:9.1f} hashes/s with {result['workers']} workers"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
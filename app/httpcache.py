@@ -0,0 +1,124 @@
+# app/httpcache.py
+#
+# Conditional GETs for pages and lists built from user and group data. Every
+# mutation bumps the data version; ETags are derived from it, so a client that
+# already has the current version gets a 304 before any query runs.
+
+import hashlib
+import time
+import uuid
+from typing import Tuple
+
+from fastapi import Request, Response
+
+from app.cache import TTLCache
+from app.config import ACTIVITY_WINDOW_SECONDS, PAGE_CACHE_SIZE, PAGE_CACHE_TTL
+from app.shared import shared_state
+
+# (nanosecond clock, random token): comparable across workers, unique per bump
+_version: Tuple[int, str] = (time.time_ns(), uuid.uuid4().hex[:8])
+
+# Rendered pages by ETag; a bump changes every ETag, so entries never go stale
+page_cache = TTLCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
+
+def data_version() -> str:
+    return f"{_version[0]:x}.{_version[1]}"
+
+
+# Called after anything shown on the dashboard or in the JSON lists changes
+def bump_data_version():
+    global _version
+    _version = (max(time.time_ns(), _version[0] + 1), uuid.uuid4().hex[:8])
+    shared_state.set_value("data_version", data_version())
+    shared_state.broadcast("data_version", version=list(_version))
+
+
+def _adopt(payload: dict):
+    global _version
+    received = tuple(payload["version"])
+    if received == _version:
+        return
+    # Take the sender's version if it is newer. If ours is newer (clock skew), move
+    # to a fresh one anyway: the sender changed data we may have pages for.
+    _version = received if received > _version else (_version[0], uuid.uuid4().hex[:8])
+
+
+# At startup every worker takes the stored version, so they send the same ETags
+# before anything changes and warm one another's 304s rather than each their own
+def _seed(value: str):
+    global _version
+    clock, _, token = value.partition(".")
+    _version = (int(clock, 16), token)
+
+
+shared_state.subscribe("data_version", _adopt)
+shared_state.share_value("data_version", data_version, _seed)
+
+# Last-seen and last-login times change on every activity flush while anyone is
+# active, so they are versioned apart from user and group data. Pages that show
+# them use the newest activity version from before the last window boundary:
+# their ETags turn over at most once per window, which is as precise as last_seen
+# is anyway, and every worker that heard of the same flushes agrees on it.
+_activity_window_ns = max(1, int(ACTIVITY_WINDOW_SECONDS * 1e9))
+_activity_shown: Tuple[int, str] = (0, "")
+_activity_pending = None
+
+
+def _settle_activity(now_ns: int):
+    global _activity_shown, _activity_pending
+    boundary = now_ns - now_ns % _activity_window_ns
+    if _activity_pending is not None and _activity_pending[0] <= boundary:
+        _activity_shown, _activity_pending = _activity_pending, None
+
+
+def _record_activity(version: Tuple[int, str]):
+    global _activity_pending
+    # A pending version from before this one's window is settled first, so it isn't lost
+    _settle_activity(version[0])
+    if version > _activity_shown and (_activity_pending is None or version > _activity_pending):
+        _activity_pending = version
+
+
+def activity_version() -> str:
+    _settle_activity(time.time_ns())
+    return f"{_activity_shown[0]:x}.{_activity_shown[1]}"
+
+
+# Called after buffered last-seen and last-login times are written
+def bump_activity_version():
+    latest = max(_activity_shown, _activity_pending or _activity_shown)
+    version = (max(time.time_ns(), latest[0] + 1), uuid.uuid4().hex[:8])
+    _record_activity(version)
+    shared_state.broadcast("activity_version", version=list(version))
+
+
+shared_state.subscribe("activity_version", lambda payload: _record_activity(tuple(payload["version"])))
+
+
+# Weak ETag over the data version and whatever else the response depends on;
+# ``activity`` for responses that show last-seen or last-login times
+def make_etag(*parts, activity: bool = False) -> str:
+    versions = (data_version(), activity_version()) if activity else (data_version(),)
+    digest = hashlib.sha1(repr(versions + parts).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+# Browsers keep the response but check back with If-None-Match every time
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie, Authorization"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
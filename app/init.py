@@ -0,0 +1,93 @@
+# app/init.py
+#
+# One-shot database initialisation: create tables, apply upgrades and the default
+# admin, then record the schema version. Run it once per deploy, before the workers:
+#
+#   python -m app.init
+#
+# Workers that find the current version recorded skip all of this at startup.
+
+import asyncio
+import logging
+
+from tortoise import Tortoise
+from tortoise.exceptions import DoesNotExist
+
+from app import auth, models
+from app.config import AUTO_INIT
+from app.database import init_db
+from app.logconfig import setup_logging
+from app.migrations import SCHEMA_VERSION, get_schema_version, set_schema_version, upgrade_schema
+from app.stats import invalidate_group_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Create default admin and administrators group
+async def create_default_admin_and_group():
+    admin_username = "admin"
+    admin_password = "admin"  # Change this in production
+    admin_email = "admin@example.com"  # Set a default email
+
+    # Create default admin user
+    try:
+        user = await models.User.get(username=admin_username)
+        logger.info("Admin user already exists.")
+    except DoesNotExist:
+        hashed_password = await auth.aget_password_hash(admin_password)
+        user = await models.User.create(
+            username=admin_username,
+            email=admin_email,
+            hashed_password=hashed_password,
+            full_name="Administrator"
+        )
+        logger.info("Default admin user created.")
+
+    # Create default "administrators" group
+    group_name = "administrators"
+    group, created = await models.Group.get_or_create(name=group_name)
+    if created:
+        logger.info("Default 'administrators' group created.")
+
+    # Add the admin user to the "administrators" group if not already added
+    if not await group.users.filter(id=user.id).exists():
+        await group.users.add(user)
+        invalidate_group_stats()
+        logger.info("Admin user added to 'administrators' group.")
+
+
+async def initialize_database():
+    await Tortoise.generate_schemas()
+    await upgrade_schema()
+    await create_default_admin_and_group()
+    await set_schema_version(SCHEMA_VERSION)
+    logger.info("Database initialised at schema version %s", SCHEMA_VERSION)
+
+
+# Called by each worker at startup; returns whether any initialisation ran
+async def ensure_database_initialized() -> bool:
+    version = await get_schema_version()
+    if version == SCHEMA_VERSION:
+        return False
+    if not AUTO_INIT:
+        # Startup is aborted, so nothing else will close the connections
+        await Tortoise.close_connections()
+        raise RuntimeError(
+            f"Database schema version is {version}, expected {SCHEMA_VERSION}; run `python -m app.init` first"
+        )
+    await initialize_database()
+    return True
+
+
+async def _main():
+    setup_logging()
+    await init_db()
+    try:
+        await initialize_database()
+    finally:
+        auth.hashing_pool.shutdown()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,248 @@
+# app/loadbench.py
+#
+# End-to-end benchmark of the auth and admin endpoints, run in-process over
+# httpx's ASGI transport against a throwaway SQLite database (no network needed):
+#
+#   python -m app.loadbench
+#   python -m app.loadbench --users 1000,10000 --requests 500 --concurrency 20 --output bench.json
+#   python -m app.loadbench --compare bench.json   # exits 1 if anything regressed
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_PASSWORD = "bench-password"
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+# Fire `total` calls of `request(i)` with at most `concurrency` in flight
+async def measure(request, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_sec": total / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+
+# Bring the user table up to `count` bench users through the bulk importer,
+# reusing one precomputed hash so seeding costs no hashing
+async def seed(count: int, groups: list, password_hash: str):
+    from app import models
+    from app.bulk import import_users
+    from app.pagination import invalidate_user_count
+    from app.stats import invalidate_group_stats
+
+    existing = await models.User.filter(username__startswith="bench").count()
+    lines = (
+        json.dumps({
+            "username": f"bench{i}",
+            "email": f"bench{i}@example.com",
+            "full_name": f"Bench User {i}",
+            "hashed_password": password_hash,
+            "groups": groups[i % len(groups)],
+        })
+        for i in range(existing, count)
+    )
+    report = await import_users(lines, "ndjson")
+    if report.failed:
+        raise RuntimeError(f"Seeding failed: {report.errors[:3]}")
+    invalidate_user_count()
+    invalidate_group_stats()
+
+
+async def run(args) -> dict:
+    from tortoise import Tortoise
+
+    from app.main import app
+
+    results = {}
+    sizes = sorted(int(size) for size in args.users.split(","))
+    groups = [f"benchgroup{i}" for i in range(args.groups)]
+
+    async with app.router.lifespan_context(app):
+        try:
+            await _scenarios(app, args, sizes, groups, results)
+        except BaseException:
+            # Lifespan shutdown is skipped on errors; open connections would keep the process alive
+            await Tortoise.close_connections()
+            raise
+    return results
+
+
+async def _scenarios(app, args, sizes: list, groups: list, results: dict):
+    import httpx
+
+    from app import auth, models
+
+    for name in groups:
+        await models.Group.get_or_create(name=name)
+    password_hash = await auth.aget_password_hash(BENCH_PASSWORD)
+    await seed(sizes[0], groups, password_hash)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as admin:
+        response = await admin.post("/admin", data={"identifier": "admin", "password": "admin"})
+        if "access_token" not in admin.cookies:
+            raise RuntimeError(f"Admin login failed ({response.status_code})")
+
+        async def login(i):
+            # Login responses set cookies; a fresh client per call keeps the jar from growing
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                return await client.post(
+                    "/admin", data={"identifier": f"bench{i % sizes[0]}", "password": BENCH_PASSWORD}
+                )
+        results["login"] = await measure(login, args.login_requests, args.concurrency)
+
+        results["home"] = await measure(lambda i: admin.get("/"), args.requests, args.concurrency)
+
+        for size in sizes:
+            await seed(size, groups, password_hash)
+            results[f"dashboard_{size}_users"] = await measure(
+                lambda i: admin.get("/admin/dashboard"), args.dashboard_requests, args.concurrency
+            )
+
+        async def toggle_membership(i):
+            # Alternate add/remove on distinct users so every call changes something
+            user = f"bench{(i // 2) % sizes[0]}"
+            if i % 2 == 0:
+                return await admin.post("/admin/add_user_to_group", data={"username": user, "group_name": "benchmutate"})
+            return await admin.post("/admin/remove_user_from_group", json={"username": user, "group_name": "benchmutate"})
+        await models.Group.get_or_create(name="benchmutate")
+        # Sequential: concurrent add/remove of the same pair would race
+        results["membership_mutation"] = await measure(toggle_membership, args.requests, 1)
+
+        async def toggle_batch(i):
+            # Ten users per call, added on even calls and removed on odd ones
+            first = (i // 2) * 10 % sizes[0]
+            return await admin.post("/admin/batch_membership", json={
+                "usernames": [f"bench{(first + n) % sizes[0]}" for n in range(10)],
+                "groups": ["benchmutate"],
+                "action": "add" if i % 2 == 0 else "remove",
+            })
+        results["batch_membership"] = await measure(toggle_batch, args.requests, 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Compare against an earlier result file; returns the list of regressions
+def compare(previous: dict, current: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            continue
+        if result["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_ms']:.1f} ms -> {result['p50_ms']:.1f} ms")
+        if result["requests_per_sec"] < before["requests_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {before['requests_per_sec']:.1f} -> {result['requests_per_sec']:.1f} requests/s"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.loadbench", description="Auth and admin endpoint benchmark")
+    parser.add_argument("--users", default="100,1000", help="Comma-separated user counts for the dashboard runs")
+    parser.add_argument("--groups", type=int, default=5, help="Groups the bench users are spread over")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per home and membership run")
+    parser.add_argument("--login-requests", type=int, default=50, help="Logins to measure (each one hashes)")
+    parser.add_argument("--dashboard-requests", type=int, default=50, help="Dashboard renders per user count")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once")
+    parser.add_argument("--db", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Earlier JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time, so the environment must be ready before app.main is loaded
+    workdir = tempfile.mkdtemp(prefix="loadbench-")
+    os.environ["DB_URL"] = f"sqlite://{args.db or os.path.join(workdir, 'bench.sqlite3')}"
+    os.environ["LOGIN_RATE_LIMIT_ENABLED"] = "false"
+    # The dashboard runs repeat one URL; with the page cache they would time cache hits, not rendering
+    os.environ["PAGE_CACHE_SIZE"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("SLOW_REQUEST_THRESHOLD_MS", "0")
+    os.environ.setdefault("TEMPLATE_AUTO_RELOAD", "false")
+
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        sys.exit("The benchmark needs httpx: pip install httpx")
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": asyncio.run(run(args)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    # A scenario whose requests fail measures the error path, not the endpoint
+    failed = [name for name, result in report["results"].items() if result["errors"]]
+    for name in failed:
+        print(f"ERRORS {name}: {report['results'][name]['errors']} failed requests", file=sys.stderr)
+
+    regressions = []
+    if previous is not None:
+        regressions = compare(previous, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# app/logconfig.py
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_ASYNC, LOG_SAMPLE_RATES
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Id of the request being served, set by the middleware in main
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed with extra= and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+_output_handler: Optional[logging.Handler] = None
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    # Accept a sane id from a proxy so log lines can be joined across services
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps each record with the current request id; must run in the calling thread."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of INFO and DEBUG records from the configured loggers.
+
+    Rates are matched on the logger name or any parent of it, so ``app`` covers
+    ``app.user_manager``. Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._by_logger: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        if name not in self._by_logger:
+            rate, probe = None, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._by_logger[name] = rate
+        return self._by_logger[name]
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, request id and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare() runs the full formatter in the caller; only merge the
+    # args here (they may change once we return) and leave formatting to the listener
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+# Replaces logging.basicConfig: records are filtered and queued on the calling
+# thread, then formatted and written by a background listener
+def setup_logging():
+    global _listener, _output_handler
+    shutdown_logging()
+
+    _output_handler = logging.StreamHandler(sys.stderr)
+    _output_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = _DeferredQueueHandler(queue.SimpleQueue()) if LOG_ASYNC else _output_handler
+    rates = _parse_rates(LOG_SAMPLE_RATES)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+    if LOG_ASYNC:
+        _listener = QueueListener(handler.queue, _output_handler)
+        _listener.start()
+
+
+# Drain queued records; anything logged afterwards is written synchronously
+def shutdown_logging():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            for log_filter in handler.filters:
+                _output_handler.addFilter(log_filter)
+            root.removeHandler(handler)
+            root.addHandler(_output_handler)
+
+
+atexit.register(shutdown_logging)
@@ -1,135 +1,356 @@
 # app/main.py
 
+import io
 import os
 import logging
 from math import ceil
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, Body
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, Body, File, UploadFile, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from jose import JWTError, jwt
-from datetime import timedelta
+from datetime import datetime, timedelta
+
+import jinja2
+import jwt
 
 from pydantic import BaseModel
-from tortoise import Tortoise
-from tortoise.exceptions import DoesNotExist
+from typing import List, Optional
+from tortoise import Tortoise, timezone
+from tortoise.expressions import Q
+from tortoise.exceptions import DoesNotExist, MultipleObjectsReturned
 from contextlib import asynccontextmanager
 
-from app import auth, models
-from app.user_manager import get_current_user
+from app import audit, auth, metrics, models, schemas
+from app.activity import activity_tracker
+from app.apikeys import issue_api_key, revoke_api_key, revoke_user_api_keys, api_key_cache
+from app.compression import CompressionMiddleware
+from app.logconfig import setup_logging, shutdown_logging, new_request_id, request_id_var
+from app.database import init_db, db_health
+from app.httpcache import bump_data_version, cache_headers, etag_matches, make_etag, not_modified, page_cache
+from app.memberships import apply_membership_batch, MEMBERSHIP_ACTIONS
+from app.permissions import (
+    PERMISSIONS,
+    group_permission_cache,
+    group_permissions,
+    has_permission,
+    invalidate_permissions,
+    permission_names,
+    require_permission,
+)
+from app.init import ensure_database_initialized
+from app.ratelimit import login_limiter
+from app.search import search_backend, search_users, iter_search_users
+from app.shared import shared_state
+from app.sessions import (
+    issue_refresh_token,
+    rotate_refresh_token,
+    revoke_refresh_token,
+    revoke_user_tokens,
+    purge_expired_refresh_tokens,
+)
+from app.pagination import fetch_user_page, count_users, invalidate_user_count, user_count_cache
+from app.stats import group_member_counts, invalidate_group_stats, group_stats_cache
+from app.user_manager import (
+    get_current_user, get_group_names, membership_changed, build_group_claims, get_membership_version,
+    principal_cache, version_cache,
+)
 from app.config import (
     INVITE_CODE_ENABLED,
     INVITE_CODE,
     REGISTRATION_ENABLED,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    DB_URL,
     EMAIL_AUTH_ENABLED, USERS_PER_PAGE,
+    TOKEN_GROUP_CLAIMS_ENABLED,
+    DASHBOARD_PAGINATION,
+    LOGIN_RATE_LIMIT_ENABLED,
+    REFRESH_TOKENS_ENABLED,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    TEMPLATE_AUTO_RELOAD,
+    TEMPLATE_CACHE_DIR,
+    METRICS_ENABLED,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_SIZE,
+    GZIP_LEVEL,
+    BROTLI_QUALITY,
+    SEARCH_MIN_CHARS,
+    SEARCH_CACHE_TTL,
+    SEARCH_MAX_RESULTS,
 )
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-templates = Jinja2Templates(directory="app/templates")
+# Compiled templates are cached as bytecode so new workers skip parsing them
+if TEMPLATE_CACHE_DIR:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+templates = Jinja2Templates(env=jinja2.Environment(
+    loader=jinja2.FileSystemLoader("app/templates"),
+    autoescape=True,
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR or None),
+))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize Tortoise ORM
-    await Tortoise.init(
-        db_url=DB_URL,
-        modules={"models": ["app.models"]}
-    )
-    conn = Tortoise.get_connection("default")
-    await conn.execute_query("PRAGMA journal_mode=DELETE;")
-    await Tortoise.generate_schemas()
+    # Initialize Tortoise ORM with the configured storage profile
+    await init_db()
+    metrics.instrument_tortoise()
 
-    # Create default admin and administrators group
-    await create_default_admin_and_group()
+    # Cold or outdated databases get their tables, upgrades and default admin;
+    # warm ones (already at SCHEMA_VERSION) skip straight to serving
+    await ensure_database_initialized()
+    await purge_expired_refresh_tokens()
+
+    # Load the token revocation list and start following other workers' invalidations
+    await shared_state.start()
+
+    # Audit events are queued by the handlers and inserted in batches by this task
+    audit.audit_writer.start()
+
+    # Buffered last-login and last-seen times are written every ACTIVITY_FLUSH_SECONDS
+    activity_tracker.start()
+
+    # Compile every template up front instead of on the first request
+    for template_name in templates.env.list_templates():
+        templates.get_template(template_name)
 
     yield
 
+    # Insert the audit events still queued and the buffered activity
+    await audit.audit_writer.stop()
+    await activity_tracker.stop()
+
+    # Send pending invalidations and stop polling for new ones
+    await shared_state.stop()
+
+    # Stop the password hashing workers
+    auth.hashing_pool.shutdown()
+
     # Close Tortoise ORM connections
     await Tortoise.close_connections()
 
+    # Write out any queued log records
+    shutdown_logging()
+
 
 app = FastAPI(lifespan=lifespan)
 
 
-# Check if the user is in a specified group
-async def is_user_in_group(user: models.User, group_name: str):
-    groups = await user.groups.all()
-    return any(group.name == group_name for group in groups)
+# Liveness and database settings
+@app.get("/health", response_class=JSONResponse)
+async def health():
+    return JSONResponse(content={"status": "ok", "database": await db_health()})
 
 
-@app.get("/", response_class=HTMLResponse)
-async def home(
-        request: Request,
-        current_user: models.User = Depends(get_current_user)
-):
-    # Check if the user is in the "administrators" group
-    is_admin = await is_user_in_group(current_user, "administrators")
-    is_manager = await is_user_in_group(current_user, "managers")
+# Sign an access token for the user, with group claims when enabled
+async def issue_access_token(user: models.User) -> str:
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    token_data = {"sub": user.username}
+    if TOKEN_GROUP_CLAIMS_ENABLED:
+        token_data.update(await build_group_claims(user))
+    return auth.create_access_token(data=token_data, expires_delta=access_token_expires)
 
-    user_group = "administrators" if is_admin else "managers" if is_manager else "Not authorized"
 
-    if not (is_admin or is_manager):
-        raise HTTPException(status_code=403, detail=f"Permission denied {user_group}")
+def set_session_cookies(response, access_token: str, refresh_token: str = None):
+    response.set_cookie(
+        key="access_token",
+        value=f"Bearer {access_token}",  # Include "Bearer " prefix
+        httponly=True,
+        secure=False,  # Set to True in production
+        samesite="lax"
+    )
+    if refresh_token:
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+            httponly=True,
+            secure=False,  # Set to True in production
+            samesite="strict"
+        )
 
-    # Return the static content if authorized
-    return templates.TemplateResponse("home.html", {
+
+async def _access_token_valid(cookie: str) -> bool:
+    try:
+        scheme, token = cookie.split(" ")
+        if scheme.lower() != "bearer":
+            return False
+        payload = auth.decode_access_token(token)
+    except (jwt.PyJWTError, ValueError):
+        return False
+    # Group claims signed before the user's groups, name or password changed are
+    # refused downstream, so such a token needs renewing just like an expired one
+    if TOKEN_GROUP_CLAIMS_ENABLED and "groups" in payload:
+        return await get_membership_version(payload.get("sub")) == payload.get("ver")
+    return True
+
+
+# Sliding sessions: when the access token is missing, expired or stale but a refresh
+# token is present, rotate it and let the request through with a fresh access token
+@app.middleware("http")
+async def refresh_session(request: Request, call_next):
+    raw_refresh = request.cookies.get("refresh_token")
+    access_cookie = request.cookies.get("access_token")
+    if (not REFRESH_TOKENS_ENABLED or not raw_refresh or request.url.path in ("/logout", "/token/refresh")
+            or (access_cookie and await _access_token_valid(access_cookie))):
+        return await call_next(request)
+
+    rotated = await rotate_refresh_token(raw_refresh)
+    if rotated is None:
+        response = await call_next(request)
+        response.delete_cookie(key="refresh_token")
+        return response
+    user, refresh_token = rotated
+    access_token = await issue_access_token(user)
+    logger.info("Access token renewed from refresh token for user: %s", user.username)
+
+    # Downstream handlers read the cookie header, so swap the new token into it
+    cookies = dict(request.cookies)
+    cookies["access_token"] = f'"Bearer {access_token}"'
+    cookie_header = "; ".join(f"{key}={value}" for key, value in cookies.items())
+    request.scope["headers"] = [
+        (name, value) for name, value in request.scope["headers"] if name != b"cookie"
+    ] + [(b"cookie", cookie_header.encode("latin-1"))]
+
+    response = await call_next(request)
+    set_session_cookies(response, access_token, refresh_token)
+    return response
+
+
+# Per-route latency, database queries and hashing time for every request.
+# Registered last so it wraps the other middleware too.
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    timer = metrics.RequestTimer()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw path, to keep the series count bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        sample = timer.finish(request.method, route, request.url.path, status_code)
+        if sample is not None:
+            logger.warning(
+                "Slow request: %s %s took %sms (%s queries, %sms in database)",
+                request.method, request.url.path, sample["duration_ms"], sample["db_queries"], sample["db_ms"],
+            )
+
+
+# Tag every log record of a request with its id, taken from X-Request-ID when a
+# proxy sets one, and echo it back. Registered last but for compression, so it wraps everything else.
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+# Added after the middleware above, so it compresses their final output
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY
+    )
+
+
+# Dashboard actions sent with an "X-Fragment: 1" header get the re-rendered
+# table row or group card back instead of a redirect to the full dashboard
+def wants_fragment(request: Request) -> bool:
+    return request.headers.get("X-Fragment") == "1"
+
+
+# "Add to Group" options for each user, computed once per render
+def available_group_names(users, group_names):
+    available = {}
+    for user in users:
+        joined = {group.name for group in user.groups}
+        available[user.id] = [name for name in group_names if name not in joined]
+    return available
+
+
+async def render_user_row(request: Request, username: str):
+    user = await models.User.get(username=username).prefetch_related("groups")
+    group_names = await models.Group.all().values_list("name", flat=True)
+    return templates.TemplateResponse("partials/user_row.html", {
         "request": request,
-        "user_group": user_group
+        "user": user,
+        "available_groups": available_group_names([user], group_names),
     })
 
 
-# Create default admin and administrators group
-async def create_default_admin_and_group():
-    admin_username = "admin"
-    admin_password = "admin"  # Change this in production
-    admin_email = "admin@example.com"  # Set a default email
+async def render_group_card(request: Request, group: models.Group):
+    member_counts = await group_member_counts()
+    return templates.TemplateResponse("partials/group_card.html", {
+        "request": request,
+        "group": group,
+        "group_user_counts": {group.name: member_counts.get(group.id, 0)},
+    })
 
-    # Create default admin user
-    try:
-        user = await models.User.get(username=admin_username)
-        logger.info("Admin user already exists.")
-    except DoesNotExist:
-        hashed_password = auth.get_password_hash(admin_password)
-        user = await models.User.create(
-            username=admin_username,
-            email=admin_email,
-            hashed_password=hashed_password,
-            full_name="Administrator"
-        )
-        logger.info("Default admin user created.")
 
-    # Create default "administrators" group
-    group_name = "administrators"
-    group, created = await models.Group.get_or_create(name=group_name)
-    if created:
-        logger.info("Default 'administrators' group created.")
+@app.get("/", response_class=HTMLResponse)
+async def home(
+        request: Request,
+        current_user: models.User = Depends(require_permission("home:view"))
+):
+    # Group names come with the principal, so labelling the page costs no queries
+    group_names = await get_group_names(current_user)
+    if "administrators" in group_names:
+        user_group = "administrators"
+    elif "managers" in group_names:
+        user_group = "managers"
+    else:
+        user_group = ", ".join(sorted(group_names))
 
-    # Add the admin user to the "administrators" group if not already added
-    if user not in await group.users.all():
-        await group.users.add(user)
-        logger.info("Admin user added to 'administrators' group.")
+    etag = make_etag("home", user_group)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Return the static content if authorized
+    return templates.TemplateResponse("home.html", {
+        "request": request,
+        "user_group": user_group
+    }, headers=cache_headers(etag))
 
 
 # Authenticate user
 async def authenticate_user(identifier: str, password: str):
     try:
         # Support email-based authentication if enabled
+        # Identifiers are matched case-insensitively through the indexed lower-cased columns
         if EMAIL_AUTH_ENABLED:
-            user = await models.User.get(email=identifier)
+            user = await models.User.get(email_lower=models.normalize_identifier(identifier))
         else:
-            user = await models.User.get(username=identifier)
+            user = await models.User.get(username_lower=models.normalize_identifier(identifier))
+    except MultipleObjectsReturned:
+        # Accounts that differ only by case predate normalisation; require the exact spelling
+        user = await models.User.get_or_none(**{"email" if EMAIL_AUTH_ENABLED else "username": identifier})
+        if user is None:
+            logger.warning("Authentication failed for identifier: %s (Ambiguous identifier)", identifier)
+            return None
     except DoesNotExist:
-        logger.warning(f"Authentication failed for identifier: {identifier} (User does not exist)")
+        # Verify against a dummy hash so unknown identifiers take as long as wrong passwords
+        await auth.dummy_verify_password(password)
+        logger.warning("Authentication failed for identifier: %s (User does not exist)", identifier)
         return None
-    if not auth.verify_password(password, user.hashed_password):
-        logger.warning(f"Authentication failed for identifier: {identifier} (Incorrect password)")
+    valid, new_hash = await auth.averify_and_update_password(password, user.hashed_password)
+    if not valid:
+        logger.warning("Authentication failed for identifier: %s (Incorrect password)", identifier)
         return None
-    logger.info(f"User authenticated successfully: {user.username}")
+    if new_hash:
+        # The stored hash uses an old scheme or cost; replace it while we have the password
+        user.hashed_password = new_hash
+        await user.save()
+        logger.info("Password hash upgraded for user: %s", user.username)
+    logger.info("User authenticated successfully: %s", user.username)
     return user
 
 
@@ -142,26 +363,52 @@ async def login_form(request: Request):
 # Handle login form submission
 @app.post("/admin", response_class=HTMLResponse)
 async def login(request: Request, identifier: str = Form(...), password: str = Form(...)):
+    limiter_key = models.normalize_identifier(identifier) or ""
+    if LOGIN_RATE_LIMIT_ENABLED:
+        # Shed abusive traffic before any bcrypt work is done
+        client_ip = request.client.host if request.client else None
+        retry_after = await login_limiter.check(client_ip, limiter_key)
+        if retry_after:
+            logger.warning("Login rate limited for identifier: %s from %s", identifier, client_ip)
+            return templates.TemplateResponse(
+                "login.html",
+                {"request": request, "error": "Too many login attempts, please try again later"},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(ceil(retry_after))},
+            )
     user = await authenticate_user(identifier, password)
     if not user:
+        if LOGIN_RATE_LIMIT_ENABLED:
+            await login_limiter.failed(limiter_key)
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid credentials"})
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    logger.info(f"Creating access token for user: {user.username}")
+    if LOGIN_RATE_LIMIT_ENABLED:
+        await login_limiter.succeeded(limiter_key)
+    activity_tracker.note_login(user.id)
+    access_token = await issue_access_token(user)
+    logger.info("Creating access token for user: %s", user.username)
+    refresh_token = await issue_refresh_token(user) if REFRESH_TOKENS_ENABLED else None
     response = RedirectResponse(url="/admin/dashboard", status_code=status.HTTP_302_FOUND)
-    response.set_cookie(
-        key="access_token",
-        value=f"Bearer {access_token}",  # Include "Bearer " prefix
-        httponly=True,
-        secure=False,  # Set to True in production
-        samesite="lax"
-    )
+    set_session_cookies(response, access_token, refresh_token)
     logger.info("Access token set in cookie")
     return response
 
 
+# Exchange the refresh token cookie for a new access token (and refresh token)
+@app.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(request: Request):
+    raw_token = request.cookies.get("refresh_token")
+    rotated = await rotate_refresh_token(raw_token) if raw_token and REFRESH_TOKENS_ENABLED else None
+    if rotated is None:
+        response = JSONResponse(status_code=401, content={"detail": "Invalid refresh token"})
+        response.delete_cookie(key="refresh_token")
+        return response
+    user, refresh_token = rotated
+    access_token = await issue_access_token(user)
+    response = JSONResponse(content={"access_token": access_token, "token_type": "bearer"})
+    set_session_cookies(response, access_token, refresh_token)
+    return response
+
+
 # Registration page
 @app.get("/register", response_class=HTMLResponse)
 async def register_form(request: Request):
@@ -192,31 +439,41 @@ async def register(
             "register.html",
             {"request": request, "error": "Invalid invite code", "invite_code_enabled": True},
         )
-    try:
-        existing_user = await models.User.get(username=username)
-        logger.warning(f"Registration attempt with existing username: {username}")
+    if email and await models.User.filter(email_lower=models.normalize_identifier(email)).exists():
+        logger.warning("Registration attempt with existing email: %s", email)
         return templates.TemplateResponse(
             "register.html",
-            {"request": request, "error": "Username already taken", "invite_code_enabled": INVITE_CODE_ENABLED},
-        )
-    except DoesNotExist:
-        hashed_password = auth.get_password_hash(password)
-        user = await models.User.create(
-            username=username,
-            email=email,
-            hashed_password=hashed_password,
-            full_name=full_name
+            {"request": request, "error": "Email already registered", "invite_code_enabled": INVITE_CODE_ENABLED},
         )
-        logger.info(f"New user registered: {username}")
+    if await models.User.filter(username_lower=models.normalize_identifier(username)).exists():
+        logger.warning("Registration attempt with existing username: %s", username)
         return templates.TemplateResponse(
-            "login.html", {"request": request, "info": "Registration successful, please log in"}
+            "register.html",
+            {"request": request, "error": "Username already taken", "invite_code_enabled": INVITE_CODE_ENABLED},
         )
+    hashed_password = await auth.aget_password_hash(password)
+    user = await models.User.create(
+        username=username,
+        email=email,
+        hashed_password=hashed_password,
+        full_name=full_name
+    )
+    invalidate_user_count()
+    logger.info("New user registered: %s", username)
+    return templates.TemplateResponse(
+        "login.html", {"request": request, "info": "Registration successful, please log in"}
+    )
 
 
-# Check if user is in "administrators" group
-async def is_administrator(user: models.User, group_name):
-    groups = await user.groups.all()
-    return any(group.name == group_name for group in groups)
+# Dashboard sort options; ties are broken by id so pages don't overlap.
+# Each is served by the index on its first column.
+DASHBOARD_SORTS = {
+    "username": ("username", "id"),
+    "last_login": ("last_login", "id"),
+    "-last_login": ("-last_login", "-id"),
+    "last_seen": ("last_seen", "id"),
+    "-last_seen": ("-last_seen", "-id"),
+}
 
 
 # Admin dashboard
@@ -224,27 +481,68 @@ async def is_administrator(user: models.User, group_name):
 async def admin_dashboard(
         request: Request,
         page: int = 1,
+        after: str = None,
+        before: str = None,
+        sort: str = "username",
+        # Bounded so the cutoff date stays representable
+        inactive_days: Optional[int] = Query(None, ge=0, le=36500),
         current_user: models.User = Depends(get_current_user)):
-    logger.info(f"Fetching users for admin: {current_user.username} on page {page}")
-
-    # Check if current_user is in "administrators" group
-    is_admin = await is_administrator(current_user, "administrators")
+    logger.info("Fetching users for admin: %s on page %s", current_user.username, page)
+
+    # Whether the viewer may change what the dashboard shows
+    is_admin = await has_permission(current_user, "users:write", "groups:write")
+
+    if sort not in DASHBOARD_SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}")
+
+    # The page depends on the data, the query string and who is looking: the navbar
+    # shows the viewer's name, and their permissions decide what they may do
+    etag = make_etag("dashboard", request.url.query, current_user.username, current_user.full_name, is_admin,
+                     activity=True)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    cached = page_cache.get(etag)
+    if cached is not None:
+        return HTMLResponse(content=cached, headers=cache_headers(etag))
+    query = models.User.all()
+    if inactive_days is not None:
+        # Dormant accounts: not seen for the given number of days, or never
+        cutoff = timezone.now() - timedelta(days=inactive_days)
+        query = query.filter(Q(last_seen__lt=cutoff) | Q(last_seen__isnull=True))
+    activity_view = sort != "username" or inactive_days is not None
 
     # Total number of users
-    total_users = await models.User.all().count()
+    if activity_view:
+        total_users, total_is_estimate = await query.count(), False
+    else:
+        total_users, total_is_estimate = await count_users()
 
     # Calculate total pages
     total_pages = ceil(total_users / USERS_PER_PAGE)
 
-    # Fetch users for the current page
-    users = await models.User.all().prefetch_related("groups").order_by("username").offset(
-        (page - 1) * USERS_PER_PAGE).limit(USERS_PER_PAGE)
+    # Fetch users for the current page; cursors only follow username order
+    use_cursor = not activity_view and (DASHBOARD_PAGINATION == "cursor" or after or before)
+    next_cursor = prev_cursor = None
+    if use_cursor:
+        try:
+            user_page = await fetch_user_page(USERS_PER_PAGE, after=after, before=before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        users = user_page.users
+        next_cursor, prev_cursor = user_page.next_cursor, user_page.prev_cursor
+    else:
+        users = await query.prefetch_related("groups").order_by(*DASHBOARD_SORTS[sort]).offset(
+            (page - 1) * USERS_PER_PAGE).limit(USERS_PER_PAGE)
 
     # Fetch all groups
-    groups = await models.Group.all().prefetch_related("users")
+    groups = await models.Group.all()
 
     # Count of users in each group
-    group_user_counts = {group.name: len(await group.users.all()) for group in groups}
+    member_counts = await group_member_counts()
+    group_user_counts = {group.name: member_counts.get(group.id, 0) for group in groups}
+
+    # Groups each listed user can still be added to
+    available_groups = available_group_names(users, [group.name for group in groups])
 
     # Count of users in "administrators" group
     admin_group_count = group_user_counts.get("administrators", 0)
@@ -253,36 +551,182 @@ async def admin_dashboard(
     DASHBOARD_TEXT = os.getenv("DASHBOARD_TEXT", "This is the admin dashboard.")
 
     # Pass data to template
-    return templates.TemplateResponse("dashboard.html", {
+    response = templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": current_user,
         "users": users,
         "groups": groups,
         "is_admin": is_admin,
         "total_users": total_users,
+        "total_is_estimate": total_is_estimate,
         "admin_group_count": admin_group_count,
         "group_user_counts": group_user_counts,
+        "available_groups": available_groups,
         "page": page,
         "total_pages": total_pages,
+        "use_cursor": use_cursor,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
         "users_per_page": USERS_PER_PAGE,
         "dashboard_text": DASHBOARD_TEXT,
-    })
+        "search_min_chars": SEARCH_MIN_CHARS,
+        "sort": sort,
+        "sorts": list(DASHBOARD_SORTS),
+        "inactive_days": inactive_days,
+        # Carried along by the page links
+        "page_query": urlencode({key: value for key, value in (("sort", sort), ("inactive_days", inactive_days))
+                                 if value is not None and (key, value) != ("sort", "username")}),
+    }, headers=cache_headers(etag))
+    page_cache.set(etag, response.body)
+    return response
+
+
+# Paged list of users as JSON
+@app.get("/admin/api/users", response_model=schemas.UserPage)
+async def list_users_api(
+        request: Request,
+        after: str = None,
+        before: str = None,
+        limit: int = USERS_PER_PAGE,
+        current_user: models.User = Depends(require_permission("users:read"))):
+    etag = make_etag("api_users", request.url.query, activity=True)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    limit = max(1, min(limit, 100))
+    try:
+        user_page = await fetch_user_page(limit, after=after, before=before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    total, total_is_estimate = await count_users()
+    page = schemas.UserPage(
+        users=[schemas.User.model_validate(user) for user in user_page.users],
+        next_cursor=user_page.next_cursor,
+        prev_cursor=user_page.prev_cursor,
+        total=total,
+        total_is_estimate=total_is_estimate,
+    )
+    return JSONResponse(content=page.model_dump(mode="json"), headers=cache_headers(etag))
+
+
+# Search users by username, email or full name. Returns JSON by default, dashboard
+# table rows for "X-Fragment: 1", and one JSON object per line for
+# "Accept: application/x-ndjson", streamed as the matches are loaded.
+@app.get("/admin/search_users", response_model=schemas.UserSearchResults)
+async def search_users_api(
+        request: Request,
+        q: str = "",
+        group: str = None,
+        is_active: bool = None,
+        limit: int = 20,
+        current_user: models.User = Depends(require_permission("users:read"))):
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    # Too-short queries match too much to be useful while the admin is still typing
+    if len(q.strip()) < SEARCH_MIN_CHARS:
+        q = ""
+    # Lets the browser answer a repeated keystroke sequence from its own cache
+    headers = {"Cache-Control": f"private, max-age={int(SEARCH_CACHE_TTL)}", "Vary": "Accept, X-Fragment"}
+
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        async def lines():
+            async for user in iter_search_users(q, group, is_active, limit):
+                yield schemas.User.model_validate(user).model_dump_json() + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+    users = await search_users(q, group, is_active, limit)
+    if wants_fragment(request):
+        group_names = await models.Group.all().values_list("name", flat=True)
+        return templates.TemplateResponse("partials/user_rows.html", {
+            "request": request,
+            "users": users,
+            "available_groups": available_group_names(users, group_names),
+        }, headers=headers)
+    results = schemas.UserSearchResults(
+        users=[schemas.User.model_validate(user) for user in users],
+        backend=await search_backend(),
+    )
+    return JSONResponse(content=results.model_dump(mode="json"), headers=headers)
+
+
+# Bulk import users from a CSV or NDJSON upload
+@app.post("/admin/import_users", response_class=JSONResponse)
+async def import_users(
+        file: UploadFile = File(...),
+        format: str = Form(None),
+        current_user: models.User = Depends(require_permission("users:write"))):
+    # Imported on first use; most workers never serve bulk requests
+    from app import bulk
+    fmt = format or bulk.guess_format(file.filename)
+    if fmt not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    report = await bulk.import_users(stream, fmt)
+    logger.info("Bulk import by %s: %s created, %s failed", current_user.username, report.created, report.failed)
+    await audit.record("users.import", current_user.username, created=report.created, failed=report.failed)
+    return JSONResponse(content=report.as_dict())
+
+
+# Stream all users as CSV or NDJSON
+@app.get("/admin/export_users")
+async def export_users(
+        format: str = "csv",
+        include_hashes: bool = False,
+        current_user: models.User = Depends(require_permission("users:read"))):
+    # Password hashes are as sensitive as the passwords they allow to be set
+    if include_hashes and not await has_permission(current_user, "users:write"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    from app import bulk
+    if format not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    logger.info("Bulk export by %s (%s)", current_user.username, format)
+    await audit.record("users.export", current_user.username, format=format, include_hashes=include_hashes)
+    return StreamingResponse(
+        bulk.export_users(format, include_hashes),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{format}"},
+    )
+
+
+# Single table row of the dashboard
+@app.get("/admin/fragments/user/{username}", response_class=HTMLResponse)
+async def user_row_fragment(
+        request: Request,
+        username: str,
+        current_user: models.User = Depends(require_permission("users:read"))):
+    try:
+        return await render_user_row(request, username)
+    except DoesNotExist:
+        raise HTTPException(status_code=404, detail="User not found")
+
+
+# Single group card of the dashboard
+@app.get("/admin/fragments/group/{group_id}", response_class=HTMLResponse)
+async def group_card_fragment(
+        request: Request,
+        group_id: int,
+        current_user: models.User = Depends(require_permission("groups:read"))):
+    try:
+        return await render_group_card(request, await models.Group.get(id=group_id))
+    except DoesNotExist:
+        raise HTTPException(status_code=404, detail="Group not found")
 
 
 # Edit user's full name
 @app.post("/admin/edit_user")
 async def edit_user(
+        request: Request,
         username: str = Form(...),
         full_name: str = Form(...),
-        current_user: models.User = Depends(get_current_user)):
-    # Only administrators can edit users
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+        current_user: models.User = Depends(require_permission("users:write"))):
     try:
         user = await models.User.get(username=username)
         user.full_name = full_name
         await user.save()
-        logger.info(f"User {username}'s full name updated to: {full_name}")
+        await membership_changed([username])
+        logger.info("User %s's full name updated to: %s", username, full_name)
+        await audit.record("user.edit", current_user.username, username, full_name=full_name)
+        if wants_fragment(request):
+            return await render_user_row(request, username)
         return RedirectResponse(url="/admin/dashboard", status_code=303)
     except DoesNotExist:
         raise HTTPException(status_code=404, detail="User not found")
@@ -291,17 +735,20 @@ async def edit_user(
 # Add user to a group
 @app.post("/admin/add_user_to_group")
 async def add_user_to_group(
+        request: Request,
         username: str = Form(...),
         group_name: str = Form(...),
-        current_user: models.User = Depends(get_current_user)):
-    # Only administrators can add users to groups
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+        current_user: models.User = Depends(require_permission("groups:write"))):
     try:
         user = await models.User.get(username=username)
         group = await models.Group.get(name=group_name)
         await user.groups.add(group)
-        logger.info(f"User {username} added to group {group_name}")
+        await membership_changed([username])
+        invalidate_group_stats()
+        logger.info("User %s added to group %s", username, group_name)
+        await audit.record("group.add_user", current_user.username, username, group=group_name)
+        if wants_fragment(request):
+            return await render_user_row(request, username)
         return RedirectResponse(url="/admin/dashboard", status_code=303)
     except DoesNotExist:
         raise HTTPException(status_code=404, detail="User or group not found")
@@ -311,10 +758,7 @@ async def add_user_to_group(
 @app.post("/admin/remove_user_from_group")
 async def remove_user_from_group(
         data: dict = Body(...),
-        current_user: models.User = Depends(get_current_user)):
-    # Only administrators can remove users from groups
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+        current_user: models.User = Depends(require_permission("groups:write"))):
     username = data.get("username")
     group_name = data.get("group_name")
     if not username or not group_name:
@@ -323,21 +767,57 @@ async def remove_user_from_group(
         user = await models.User.get(username=username)
         group = await models.Group.get(name=group_name)
         await user.groups.remove(group)
-        logger.info(f"User {username} removed from group {group_name}")
-        return JSONResponse(content={"success": True})
+        await membership_changed([username])
+        invalidate_group_stats()
+        logger.info("User %s removed from group %s", username, group_name)
+        await audit.record("group.remove_user", current_user.username, username, group=group_name)
+        return JSONResponse(content={"success": True, "user_id": user.id})
     except DoesNotExist:
         return JSONResponse(content={"success": False, "error": "User or group not found"})
 
 
+# Pydantic model for batch membership changes
+class MembershipBatchRequest(BaseModel):
+    usernames: List[str]
+    groups: List[str]
+    action: str = "add"  # "add", "remove" or "replace"
+
+
+# Add, remove or replace group memberships for many users at once
+@app.post("/admin/batch_membership", response_class=JSONResponse)
+async def batch_membership(
+        batch: MembershipBatchRequest,
+        current_user: models.User = Depends(require_permission("groups:write"))):
+    if batch.action not in MEMBERSHIP_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action: {batch.action}")
+    try:
+        summary = await apply_membership_batch(batch.usernames, batch.groups, batch.action)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    changed = summary.pop("changed_usernames")
+    if changed:
+        await membership_changed(changed)
+        invalidate_group_stats()
+    logger.info("Batch membership %s by %s: %s added, %s removed",
+                batch.action, current_user.username, summary["added"], summary["removed"])
+    await audit.record("group.batch_membership", current_user.username, batch_action=batch.action,
+                       usernames=batch.usernames, groups=batch.groups,
+                       added=summary["added"], removed=summary["removed"])
+    return JSONResponse(content={"success": True, **summary})
+
+
 # Create a new group
 @app.post("/admin/create_group")
-async def create_group(group_name: str = Form(...), current_user: models.User = Depends(get_current_user)):
-    # Only administrators can create groups
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+async def create_group(request: Request, group_name: str = Form(...),
+                       current_user: models.User = Depends(require_permission("groups:write"))):
     group, created = await models.Group.get_or_create(name=group_name)
     if created:
-        logger.info(f"Group created: {group_name}")
+        # New groups show up on the dashboard; nothing else invalidates for them
+        bump_data_version()
+        logger.info("Group created: %s", group_name)
+        await audit.record("group.create", current_user.username, group_name)
+        if wants_fragment(request):
+            return await render_group_card(request, group)
         return RedirectResponse(url="/admin/dashboard", status_code=303)
     else:
         raise HTTPException(status_code=400, detail="Group already exists")
@@ -345,16 +825,20 @@ async def create_group(group_name: str = Form(...), current_user: models.User =
 
 # Rename an existing group
 @app.post("/admin/rename_group")
-async def rename_group(group_id: int = Form(...), new_name: str = Form(...),
-                       current_user: models.User = Depends(get_current_user)):
-    # Only administrators can rename groups
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+async def rename_group(request: Request, group_id: int = Form(...), new_name: str = Form(...),
+                       current_user: models.User = Depends(require_permission("groups:write"))):
     try:
         group = await models.Group.get(id=group_id)
+        old_name = group.name
         group.name = new_name
         await group.save()
-        logger.info(f"Group renamed to: {new_name}")
+        await membership_changed(await group.users.all().values_list("username", flat=True))
+        # Grants are compiled per group name
+        invalidate_permissions()
+        logger.info("Group renamed to: %s", new_name)
+        await audit.record("group.rename", current_user.username, new_name, old_name=old_name)
+        if wants_fragment(request):
+            return await render_group_card(request, group)
         return RedirectResponse(url="/admin/dashboard", status_code=303)
     except DoesNotExist:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -367,29 +851,28 @@ class GroupDeleteRequest(BaseModel):
 @app.post("/admin/delete_group")
 async def delete_group(
     request: GroupDeleteRequest,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(require_permission("groups:write"))
 ):
-    # Only administrators can delete groups
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
-
     name = request.name
     try:
         group = await models.Group.get(name=name)
+        members = await group.users.all().values_list("username", flat=True)
         await group.delete()
-        logger.info(f"Group deleted: {name}")
+        await membership_changed(members)
+        invalidate_group_stats()
+        invalidate_permissions()
+        logger.info("Group deleted: %s", name)
+        await audit.record("group.delete", current_user.username, name, members=len(members))
         return JSONResponse(content={"success": True})
     except DoesNotExist:
-        logger.error(f"Group '{name}' not found")
+        logger.error("Group '%s' not found", name)
         return JSONResponse(content={"success": False, "error": f"Group '{name}' not found"})
 
 
 # Handle user deletion
 @app.post("/admin/delete_user")
-async def delete_user(username: str = Form(...), current_user: models.User = Depends(get_current_user)):
-    # Only administrators can delete users
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
+async def delete_user(request: Request, username: str = Form(...),
+                      current_user: models.User = Depends(require_permission("users:write"))):
     # Prevent admins from deleting themselves
     if username == current_user.username:
         logger.warning("Admin attempted to delete themselves")
@@ -397,11 +880,20 @@ async def delete_user(username: str = Form(...), current_user: models.User = Dep
 
     try:
         user_to_delete = await models.User.get(username=username)
+        await revoke_user_tokens(user_to_delete.id)
+        await auth.revoke_user_access_tokens(username)
         await user_to_delete.delete()
-        logger.info(f"User deleted: {username}")
+        invalidate_user_count()
+        invalidate_group_stats()
+        await membership_changed([username])
+        logger.info("User deleted: %s", username)
+        await audit.record("user.delete", current_user.username, username)
+        if wants_fragment(request):
+            # The row is gone; an empty fragment tells the page to drop it
+            return HTMLResponse(content="")
         return RedirectResponse(url="/admin/dashboard", status_code=status.HTTP_303_SEE_OTHER)
     except DoesNotExist:
-        logger.warning(f"Attempted to delete non-existent user: {username}")
+        logger.warning("Attempted to delete non-existent user: %s", username)
         raise HTTPException(status_code=404, detail="User not found")
 
 
@@ -416,29 +908,206 @@ class PasswordChangeRequest(BaseModel):
 async def change_user_password(
         request: Request,
         password_change: PasswordChangeRequest,
-        current_user: models.User = Depends(get_current_user)):
-    # Only administrators can change user passwords
-    if not await is_administrator(current_user, "administrators"):
-        raise HTTPException(status_code=403, detail="Permission denied")
-
+        current_user: models.User = Depends(require_permission("users:write"))):
     try:
         user = await models.User.get(id=password_change.user_id)
     except DoesNotExist:
         return JSONResponse(content={"success": False, "error": "User not found"})
 
     # Update the user's password
-    hashed_password = auth.get_password_hash(password_change.new_password)
+    hashed_password = await auth.aget_password_hash(password_change.new_password)
     user.hashed_password = hashed_password
     await user.save()
+    await revoke_user_tokens(user.id)
+    await auth.revoke_user_access_tokens(user.username)
+    # A key minted by whoever had the old password must not outlive it
+    api_keys_revoked = await revoke_user_api_keys(user.id)
+    await membership_changed([user.username])
+
+    logger.info("Password changed for user: %s by admin: %s", user.username, current_user.username)
+    await audit.record("user.change_password", current_user.username, user.username,
+                       api_keys_revoked=api_keys_revoked)
+    return JSONResponse(content={"success": True, "api_keys_revoked": api_keys_revoked})
+
+
+# Password hashing pool statistics
+@app.get("/admin/hash_stats", response_class=JSONResponse)
+async def hash_stats(current_user: models.User = Depends(require_permission("system:read"))):
+    return JSONResponse(content=auth.hashing_pool.stats())
+
+
+def api_key_info(api_key: models.ApiKey, **extra) -> dict:
+    return schemas.ApiKey(
+        id=api_key.id,
+        name=api_key.name,
+        prefix=api_key.prefix,
+        scopes=api_key.scopes.split(),
+        created_at=api_key.created_at,
+        expires_at=api_key.expires_at,
+        last_used_at=api_key.last_used_at,
+        revoked_at=api_key.revoked_at,
+    ).model_dump(mode="json") | extra
+
+
+# Pydantic model for creating an API key
+class ApiKeyRequest(BaseModel):
+    name: str
+    scopes: List[str] = []  # empty: everything the user may do
+    expires_days: int = None
+
+
+# API keys of the current user
+@app.get("/api_keys", response_model=List[schemas.ApiKey])
+async def list_api_keys(current_user: models.User = Depends(get_current_user)):
+    keys = await models.ApiKey.filter(user_id=current_user.id).order_by("-created_at")
+    return JSONResponse(content=[api_key_info(key) for key in keys])
+
 
-    logger.info(f"Password changed for user: {user.username} by admin: {current_user.username}")
+# Create an API key for the current user; the key is only ever returned here
+@app.post("/api_keys", response_model=schemas.ApiKeyCreated)
+async def create_api_key(
+        key_request: ApiKeyRequest,
+        current_user: models.User = Depends(get_current_user)):
+    # A leaked key must not be able to mint longer-lived or broader ones
+    if getattr(current_user, "api_key_id", None) is not None:
+        raise HTTPException(status_code=403, detail="API keys cannot manage API keys")
+    unknown = sorted(set(key_request.scopes) - set(PERMISSIONS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown permissions: {', '.join(unknown)}")
+    if key_request.expires_days is not None and key_request.expires_days < 1:
+        raise HTTPException(status_code=400, detail="expires_days must be at least 1")
+    key, raw_key = await issue_api_key(current_user, key_request.name, key_request.scopes, key_request.expires_days)
+    logger.info("API key %s created for user: %s", key.prefix, current_user.username)
+    await audit.record("api_key.create", current_user.username, current_user.username,
+                       prefix=key.prefix, scopes=key.scopes.split(), expires_days=key_request.expires_days)
+    return JSONResponse(content=api_key_info(key, key=raw_key))
+
+
+# Revoke one of the current user's API keys; users:write may revoke anyone's
+@app.post("/api_keys/{key_id}/revoke", response_class=JSONResponse)
+async def revoke_api_key_route(key_id: int, current_user: models.User = Depends(get_current_user)):
+    key = await models.ApiKey.get_or_none(id=key_id)
+    if key is None or (key.user_id != current_user.id and not await has_permission(current_user, "users:write")):
+        raise HTTPException(status_code=404, detail="API key not found")
+    await revoke_api_key(key)
+    await audit.record("api_key.revoke", current_user.username, key.prefix)
     return JSONResponse(content={"success": True})
 
 
+# Pydantic model for granting or revoking group permissions
+class GroupPermissionRequest(BaseModel):
+    group_name: str
+    permissions: List[str]
+    action: str = "grant"  # "grant" or "revoke"
+
+
+# Known permissions and what each group is effectively granted
+@app.get("/admin/permissions", response_class=JSONResponse)
+async def list_permissions(
+        request: Request,
+        current_user: models.User = Depends(require_permission("permissions:manage"))):
+    etag = make_etag("permissions")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    compiled = await group_permissions()
+    return JSONResponse(content={
+        "permissions": list(PERMISSIONS),
+        "groups": {name: permission_names(bits) for name, bits in sorted(compiled.items())},
+    }, headers=cache_headers(etag))
+
+
+# Grant permissions to a group or revoke them
+@app.post("/admin/group_permissions", response_class=JSONResponse)
+async def change_group_permissions(
+        change: GroupPermissionRequest,
+        current_user: models.User = Depends(require_permission("permissions:manage"))):
+    if change.action not in ("grant", "revoke"):
+        raise HTTPException(status_code=400, detail=f"Unknown action: {change.action}")
+    unknown = sorted(set(change.permissions) - set(PERMISSIONS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown permissions: {', '.join(unknown)}")
+    try:
+        group = await models.Group.get(name=change.group_name)
+    except DoesNotExist:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if change.action == "grant":
+        existing = set(await models.GroupPermission.filter(group=group).values_list("permission", flat=True))
+        await models.GroupPermission.bulk_create([
+            models.GroupPermission(group=group, permission=name)
+            for name in sorted(set(change.permissions) - existing)
+        ])
+    else:
+        await models.GroupPermission.filter(group=group, permission__in=change.permissions).delete()
+    invalidate_permissions()
+    logger.info("Permissions %s for group %s by %s: %s",
+                change.action, group.name, current_user.username, ", ".join(change.permissions))
+    await audit.record(f"permissions.{change.action}", current_user.username, group.name,
+                       permissions=change.permissions)
+    compiled = await group_permissions()
+    return JSONResponse(content={"success": True, "permissions": permission_names(compiled.get(group.name, 0))})
+
+
+# Audit events, newest first; follow next_before_id for older pages
+@app.get("/admin/audit", response_model=schemas.AuditPage)
+async def audit_log(
+        actor: str = None,
+        target: str = None,
+        action: str = None,
+        since: datetime = None,
+        until: datetime = None,
+        before_id: int = None,
+        limit: int = 50,
+        current_user: models.User = Depends(require_permission("audit:read"))):
+    limit = max(1, min(limit, 500))
+    events = await audit.query_events(actor, target, action, since, until, before_id, limit)
+    page = schemas.AuditPage(
+        events=[schemas.AuditEvent.model_validate(event) for event in events],
+        next_before_id=events[-1].id if len(events) == limit else None,
+        writer=audit.audit_writer.stats(),
+    )
+    return JSONResponse(content=page.model_dump(mode="json"))
+
+
+# Prometheus text exposition of the request, database, hashing and cache metrics.
+# Scrapers authenticate with an API key scoped to system:read.
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(current_user: models.User = Depends(require_permission("system:read"))):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    cache_stats = {
+        "principal": principal_cache.stats(),
+        "membership_version": version_cache.stats(),
+        "token": auth.token_cache.stats(),
+        "user_count": user_count_cache.stats(),
+        "group_stats": group_stats_cache.stats(),
+        "page": page_cache.stats(),
+        "permissions": group_permission_cache.stats(),
+        "api_key": api_key_cache.stats(),
+    }
+    return PlainTextResponse(
+        metrics.render_metrics(cache_stats, auth.hashing_pool.stats()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+# Most recent requests slower than SLOW_REQUEST_THRESHOLD_MS, with profiles when sampled
+@app.get("/admin/slow_requests", response_class=JSONResponse)
+async def slow_requests(current_user: models.User = Depends(require_permission("system:read"))):
+    return JSONResponse(content=list(reversed(metrics.slow_requests)))
+
+
 # Logout route
 @app.post("/logout")
-async def logout():
+async def logout(request: Request):
+    raw_refresh = request.cookies.get("refresh_token")
+    if raw_refresh:
+        await revoke_refresh_token(raw_refresh)
+    # Deleting the cookie is not enough: a copied token would stay valid until it expires
+    access_cookie = request.cookies.get("access_token")
+    if access_cookie:
+        await auth.revoke_access_token(access_cookie.removeprefix("Bearer "))
     response = RedirectResponse(url="/admin", status_code=status.HTTP_302_FOUND)
     response.delete_cookie(key="access_token")
+    response.delete_cookie(key="refresh_token")
     logger.info("User logged out and access_token cookie deleted")
     return response
@@ -0,0 +1,120 @@
+# app/memberships.py
+
+from typing import Iterable, List, Set, Tuple
+
+from pypika import Table, Tuple as PypikaTuple
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app import models
+
+# The many-to-many table behind Group.users / User.groups
+user_group = Table("user_group")
+
+
+# Insert (group_id, user_id) pairs with one multi-row INSERT
+async def add_memberships(pairs: Iterable[Tuple[int, int]]):
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    conn = Tortoise.get_connection("default")
+    query = conn.query_class.into(user_group).columns("group_id", "user_id").insert(*pairs)
+    await conn.execute_script(query.get_sql())
+
+
+# Remove (group_id, user_id) pairs with one DELETE
+async def remove_memberships(pairs: Iterable[Tuple[int, int]]):
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    conn = Tortoise.get_connection("default")
+    query = conn.query_class.from_(user_group).where(
+        PypikaTuple(user_group.group_id, user_group.user_id).isin(pairs)
+    ).delete()
+    await conn.execute_script(query.get_sql())
+
+
+# Existing (group_id, user_id) pairs for the given users
+async def fetch_memberships(user_ids: Iterable[int]) -> Set[Tuple[int, int]]:
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return set()
+    conn = Tortoise.get_connection("default")
+    query = conn.query_class.from_(user_group).select(
+        user_group.group_id, user_group.user_id
+    ).where(user_group.user_id.isin(user_ids))
+    _, rows = await conn.execute_query(query.get_sql())
+    return {(row["group_id"], row["user_id"]) for row in rows}
+
+
+MEMBERSHIP_ACTIONS = ("add", "remove", "replace")
+
+
+# Apply one action to every (username, group) combination in a single transaction.
+# "replace" makes the given groups the users' complete membership set, so it is
+# refused outright when the set is empty or names a group that doesn't exist:
+# a typo would otherwise strip the users of every group they are in.
+async def apply_membership_batch(usernames: List[str], group_names: List[str], action: str) -> dict:
+    if action not in MEMBERSHIP_ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    usernames = list(dict.fromkeys(usernames))
+    group_names = list(dict.fromkeys(group_names))
+    if action == "replace" and not group_names:
+        raise ValueError("Replace needs at least one group")
+    results = []
+
+    user_ids = dict(await models.User.filter(username__in=usernames).values_list("username", "id"))
+    group_ids = dict(await models.Group.filter(name__in=group_names).values_list("name", "id"))
+    unknown_groups = [name for name in group_names if name not in group_ids]
+    if action == "replace" and unknown_groups:
+        raise ValueError(f"Groups not found: {', '.join(unknown_groups)}")
+    for username in usernames:
+        if username not in user_ids:
+            results.append({"username": username, "group": None, "status": "user_not_found"})
+    for name in unknown_groups:
+        results.append({"username": None, "group": name, "status": "group_not_found"})
+
+    requested = {
+        (group_ids[name], user_ids[username]): (username, name)
+        for username in usernames if username in user_ids
+        for name in group_names if name in group_ids
+    }
+    to_add, to_remove = set(), set()
+    async with in_transaction():
+        existing = await fetch_memberships(user_ids.values())
+        if action in ("add", "replace"):
+            to_add = set(requested) - existing
+        if action == "remove":
+            to_remove = set(requested) & existing
+        elif action == "replace":
+            to_remove = existing - set(requested)
+        await remove_memberships(to_remove)
+        await add_memberships(to_add)
+
+    for pair, (username, name) in requested.items():
+        if pair in to_add:
+            status = "added"
+        elif pair in to_remove:
+            status = "removed"
+        elif action == "remove":
+            status = "not_member"
+        else:
+            status = "already_member"
+        results.append({"username": username, "group": name, "status": status})
+    if action == "replace" and to_remove:
+        # Memberships dropped by "replace" are for groups outside the request
+        names_by_id = {group_id: name for name, group_id in group_ids.items()}
+        missing_ids = {group_id for group_id, _ in to_remove if group_id not in names_by_id}
+        if missing_ids:
+            names_by_id.update(await models.Group.filter(id__in=missing_ids).values_list("id", "name"))
+        usernames_by_id = {user_id: username for username, user_id in user_ids.items()}
+        for group_id, user_id in sorted(to_remove):
+            results.append({"username": usernames_by_id[user_id], "group": names_by_id.get(group_id), "status": "removed"})
+
+    changed_user_ids = {user_id for _, user_id in to_add | to_remove}
+    return {
+        "added": len(to_add),
+        "removed": len(to_remove),
+        "changed_usernames": [username for username, user_id in user_ids.items() if user_id in changed_user_ids],
+        "results": results,
+    }
@@ -0,0 +1,274 @@
+# app/metrics.py
+
+import random
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from app.config import (
+    SLOW_REQUEST_THRESHOLD_MS,
+    SLOW_REQUEST_PROFILE_RATE,
+    SLOW_REQUEST_SAMPLES,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts are stored per bucket and summed on render."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    """Histograms of one metric, keyed by their label values."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.children: Dict[Tuple[str, ...], Histogram] = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        child = self.children.get(label_values)
+        if child is None:
+            child = self.children[label_values] = Histogram(self.buckets)
+        child.observe(value)
+
+
+@dataclass
+class RequestStats:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    hash_seconds: float = 0.0
+
+
+request_latency = HistogramFamily(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"), LATENCY_BUCKETS
+)
+request_db_queries = HistogramFamily(
+    "http_request_db_queries", "Database queries issued per request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+request_db_seconds = HistogramFamily(
+    "http_request_db_seconds", "Time spent in database queries per request", ("method", "route"), LATENCY_BUCKETS
+)
+password_hash_seconds = HistogramFamily(
+    "password_hash_seconds", "Time spent hashing or verifying one password", (), LATENCY_BUCKETS
+)
+
+# Process-wide totals, including queries made outside any request (startup, CLIs)
+db_queries_total = 0
+db_query_seconds_total = 0.0
+requests_in_progress = 0
+slow_requests_total = 0
+
+# Most recent slow requests, newest last
+slow_requests = deque(maxlen=SLOW_REQUEST_SAMPLES)
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+# Set while a query is being timed so nested client calls are not counted twice
+_in_query: ContextVar[bool] = ContextVar("in_query", default=False)
+_profiling = False
+
+QUERY_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+
+def _instrument_query_method(func):
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if _in_query.get():
+            return await func(self, *args, **kwargs)
+        token = _in_query.set(True)
+        start = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            _in_query.reset(token)
+            _record_query(time.perf_counter() - start)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def _record_query(elapsed: float):
+    global db_queries_total, db_query_seconds_total
+    db_queries_total += 1
+    db_query_seconds_total += elapsed
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+
+def _client_classes(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _client_classes(subclass)
+
+
+# Wrap the query methods of every loaded Tortoise client class (including its
+# transaction wrappers); call after the connections are initialised
+def instrument_tortoise():
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+    for cls in set(_client_classes(BaseDBAsyncClient)):
+        for name in QUERY_METHODS:
+            func = cls.__dict__.get(name)
+            if func is not None and not getattr(func, "__metrics_wrapped__", False):
+                setattr(cls, name, _instrument_query_method(func))
+
+
+# Called by the hashing pool with the worker-side time of each hash
+def record_hash_time(elapsed: float):
+    password_hash_seconds.observe((), elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.hash_seconds += elapsed
+
+
+class RequestTimer:
+    """Tracks one request from the middleware: latency, queries and an optional profile."""
+
+    def __init__(self):
+        global requests_in_progress, _profiling
+        self.stats = RequestStats()
+        self._token = _request_stats.set(self.stats)
+        self._profiler = None
+        # cProfile sees the whole event loop thread, so only one request is profiled at a time
+        if SLOW_REQUEST_PROFILE_RATE > 0 and not _profiling and random.random() < SLOW_REQUEST_PROFILE_RATE:
+            import cProfile
+
+            _profiling = True
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        requests_in_progress += 1
+        self._start = time.perf_counter()
+
+    def finish(self, method: str, route: str, path: str, status_code: int) -> Optional[dict]:
+        """Record the request; returns a sample dict when it was slower than the threshold."""
+        global requests_in_progress, slow_requests_total, _profiling
+        elapsed = time.perf_counter() - self._start
+        requests_in_progress -= 1
+        if self._profiler is not None:
+            self._profiler.disable()
+            _profiling = False
+        _request_stats.reset(self._token)
+
+        request_latency.observe((method, route, str(status_code)), elapsed)
+        request_db_queries.observe((method, route), self.stats.db_queries)
+        request_db_seconds.observe((method, route), self.stats.db_seconds)
+
+        if not SLOW_REQUEST_THRESHOLD_MS or elapsed * 1000 < SLOW_REQUEST_THRESHOLD_MS:
+            return None
+        slow_requests_total += 1
+        sample = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "method": method,
+            "route": route,
+            "path": path,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 3),
+            "db_queries": self.stats.db_queries,
+            "db_ms": round(self.stats.db_seconds * 1000, 3),
+            "hash_ms": round(self.stats.hash_seconds * 1000, 3),
+            "profile": _format_profile(self._profiler) if self._profiler is not None else None,
+        }
+        slow_requests.append(sample)
+        return sample
+
+
+def _format_profile(profiler, limit: int = 30) -> str:
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _render_histogram(family: HistogramFamily, lines: list):
+    lines.append(f"# HELP {family.name} {family.help_text}")
+    lines.append(f"# TYPE {family.name} histogram")
+    for label_values, hist in sorted(family.children.items()):
+        series = _labels(family.labels, label_values)
+        prefix = series[:-1] + "," if series else "{"
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f'{family.name}_bucket{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{family.name}_bucket{prefix}le="+Inf"}} {hist.count}')
+        lines.append(f"{family.name}_sum{series} {hist.sum}")
+        lines.append(f"{family.name}_count{series} {hist.count}")
+
+
+def _render_scalar(name: str, kind: str, help_text: str, samples, lines: list):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{labels} {value}")
+
+
+# Prometheus text exposition of everything above, plus the given cache and hashing pool stats
+def render_metrics(cache_stats: Dict[str, dict], hashing_stats: dict) -> str:
+    lines = []
+    for family in (request_latency, request_db_queries, request_db_seconds, password_hash_seconds):
+        _render_histogram(family, lines)
+
+    _render_scalar("http_requests_in_progress", "gauge", "Requests currently being served",
+                   [("", requests_in_progress)], lines)
+    _render_scalar("http_slow_requests_total", "counter", "Requests slower than SLOW_REQUEST_THRESHOLD_MS",
+                   [("", slow_requests_total)], lines)
+    _render_scalar("db_queries_total", "counter", "Database queries issued by this process",
+                   [("", db_queries_total)], lines)
+    _render_scalar("db_query_seconds_total", "counter", "Time spent in database queries",
+                   [("", db_query_seconds_total)], lines)
+
+    _render_scalar("password_hash_in_flight", "gauge", "Hashes running or queued",
+                   [("", hashing_stats["in_flight"])], lines)
+    _render_scalar("password_hash_queue_depth", "gauge", "Hashes waiting for a worker",
+                   [("", hashing_stats["queue_depth"])], lines)
+    _render_scalar("password_hash_rejected_total", "counter", "Hashes rejected because the pool was full",
+                   [("", hashing_stats["rejected"])], lines)
+    _render_scalar("password_hash_wait_seconds_total", "counter", "Time hashes spent waiting for a worker",
+                   [("", hashing_stats["wait_seconds_total"])], lines)
+
+    names = sorted(cache_stats)
+    _render_scalar("cache_hits_total", "counter", "Cache lookups that found a live entry",
+                   [(_labels(("cache",), (name,)), cache_stats[name]["hits"]) for name in names], lines)
+    _render_scalar("cache_misses_total", "counter", "Cache lookups that found nothing",
+                   [(_labels(("cache",), (name,)), cache_stats[name]["misses"]) for name in names], lines)
+    _render_scalar("cache_hit_ratio", "gauge", "Hits over all lookups since startup",
+                   [(_labels(("cache",), (name,)), _hit_ratio(cache_stats[name])) for name in names], lines)
+    _render_scalar("cache_entries", "gauge", "Entries currently held",
+                   [(_labels(("cache",), (name,)), cache_stats[name]["size"]) for name in names], lines)
+    return "\n".join(lines) + "\n"
+
+
+def _hit_ratio(stats: dict) -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
@@ -0,0 +1,174 @@
+# app/migrations.py
+
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError, OperationalError
+
+from app.models import User, normalize_identifier
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+async def _backfill_identifiers():
+    while True:
+        users = await User.filter(username_lower__isnull=True).limit(BACKFILL_BATCH_SIZE)
+        if not users:
+            return
+        for user in users:
+            user.username_lower = normalize_identifier(user.username)
+            user.email_lower = normalize_identifier(user.email)
+        await User.bulk_update(users, fields=["username_lower", "email_lower"])
+
+
+# Columns added to existing tables after their first release.
+# generate_schemas() only creates missing tables, so these are applied by hand,
+# followed by the backfill (if any) that fills them in for existing rows.
+ADDED_COLUMNS = [
+    ("user", "membership_version", "INT NOT NULL DEFAULT 0", None),
+    ("user", "username_lower", "VARCHAR(50)", _backfill_identifiers),
+    ("user", "email_lower", "VARCHAR(100)", _backfill_identifiers),
+    ("user", "last_login", "TIMESTAMP", None),
+    ("user", "last_seen", "TIMESTAMP", None),
+]
+
+# Unique constraints for added columns; ALTER TABLE cannot add them inline on SQLite
+ADDED_UNIQUE_INDEXES = [
+    ("uidx_user_username_lower", "user", "username_lower"),
+    ("uidx_user_email_lower", "user", "email_lower"),
+]
+
+# Plain indexes on added columns, created on new and upgraded databases alike.
+# They can't go in the models' Meta: generate_schemas() would try to create them
+# on an existing table before upgrade_schema() has added the columns.
+ADDED_INDEXES = [
+    ("idx_user_last_login", "user", "last_login"),
+    ("idx_user_last_seen", "user", "last_seen"),
+]
+
+
+async def _existing_columns(conn, table: str) -> set:
+    if conn.capabilities.dialect == "sqlite":
+        _, rows = await conn.execute_query(f'PRAGMA table_info("{table}")')
+        return {row["name"] for row in rows}
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "$1"
+    _, rows = await conn.execute_query(
+        f"SELECT column_name FROM information_schema.columns WHERE table_name = {placeholder}", [table]
+    )
+    return {row["column_name"] for row in rows}
+
+
+async def _create_unique_index(conn, name: str, table: str, column: str):
+    try:
+        await conn.execute_script(f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}")')
+    except (IntegrityError, OperationalError) as e:
+        # Rows that only differ by case predate the constraint; keep the lookup fast anyway
+        logger.warning("Could not make %s.%s unique (%s); creating a plain index instead", table, column, e)
+        await conn.execute_script(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}")')
+
+
+# Bring tables created by an older release up to date with the models
+async def upgrade_schema():
+    conn = Tortoise.get_connection("default")
+    columns_by_table = {}
+    added = set()
+    backfills = []
+    for table, column, ddl, backfill in ADDED_COLUMNS:
+        if table not in columns_by_table:
+            columns_by_table[table] = await _existing_columns(conn, table)
+        if column in columns_by_table[table]:
+            continue
+        await conn.execute_script(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+        columns_by_table[table].add(column)
+        added.add((table, column))
+        if backfill is not None and backfill not in backfills:
+            backfills.append(backfill)
+        logger.info("Added column %s.%s", table, column)
+
+    # Backfills run once every new column exists, since they load full model rows
+    for backfill in backfills:
+        await backfill()
+
+    for name, table, column in ADDED_UNIQUE_INDEXES:
+        if (table, column) in added:
+            await _create_unique_index(conn, name, table, column)
+
+    for name, table, column in ADDED_INDEXES:
+        await conn.execute_script(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}")')
+
+    await _create_search_index(conn)
+
+
+# SQLite: an FTS5 table over the user columns, kept in sync by triggers
+SQLITE_SEARCH_DDL = """
+CREATE VIRTUAL TABLE "user_search" USING fts5(username, email, full_name, content='user', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS "user_search_ai" AFTER INSERT ON "user" BEGIN
+    INSERT INTO "user_search" (rowid, username, email, full_name) VALUES (new.id, new.username, new.email, new.full_name);
+END;
+CREATE TRIGGER IF NOT EXISTS "user_search_ad" AFTER DELETE ON "user" BEGIN
+    INSERT INTO "user_search" ("user_search", rowid, username, email, full_name)
+    VALUES ('delete', old.id, old.username, old.email, old.full_name);
+END;
+CREATE TRIGGER IF NOT EXISTS "user_search_au" AFTER UPDATE OF username, email, full_name ON "user" BEGIN
+    INSERT INTO "user_search" ("user_search", rowid, username, email, full_name)
+    VALUES ('delete', old.id, old.username, old.email, old.full_name);
+    INSERT INTO "user_search" (rowid, username, email, full_name) VALUES (new.id, new.username, new.email, new.full_name);
+END;
+INSERT INTO "user_search" ("user_search") VALUES ('rebuild');
+"""
+
+# Postgres: a trigram index over the same columns, serving substring matches
+POSTGRES_SEARCH_DDL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "idx_user_search_trgm" ON "user" USING gin (
+    (lower("username") || ' ' || lower(coalesce("email", '')) || ' ' || lower(coalesce("full_name", ''))) gin_trgm_ops
+);
+"""
+
+
+# Full-text index for user search; without one, search falls back to indexed prefix matching
+async def _create_search_index(conn):
+    dialect = conn.capabilities.dialect
+    try:
+        if dialect == "sqlite":
+            _, rows = await conn.execute_query("SELECT 1 FROM sqlite_master WHERE name = 'user_search'")
+            if not rows:
+                await conn.execute_script(SQLITE_SEARCH_DDL)
+                logger.info("Created full-text search index user_search")
+        elif dialect == "postgres":
+            await conn.execute_script(POSTGRES_SEARCH_DDL)
+    except OperationalError as e:
+        # SQLite builds without FTS5, or a Postgres role that may not create extensions
+        logger.warning("Full-text user search unavailable (%s); using prefix matching", e)
+
+
+# Bump whenever a model, ADDED_COLUMNS, ADDED_UNIQUE_INDEXES or ADDED_INDEXES changes, so
+# workers starting against an older database run the upgrade again
+SCHEMA_VERSION = 6
+
+
+async def _create_version_table(conn):
+    await conn.execute_script(
+        'CREATE TABLE IF NOT EXISTS "schema_version" ("version" INT NOT NULL, "applied_at" VARCHAR(32) NOT NULL)'
+    )
+
+
+async def get_schema_version() -> Optional[int]:
+    conn = Tortoise.get_connection("default")
+    await _create_version_table(conn)
+    _, rows = await conn.execute_query('SELECT MAX("version") AS "version" FROM "schema_version"')
+    return rows[0]["version"] if rows else None
+
+
+async def set_schema_version(version: int):
+    conn = Tortoise.get_connection("default")
+    # `python -m app.init` records the version without reading it first
+    await _create_version_table(conn)
+    applied_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    await conn.execute_script(
+        f'INSERT INTO "schema_version" ("version", "applied_at") VALUES ({int(version)}, \'{applied_at}\')'
+    )
@@ -15,18 +15,106 @@ class Group(models.Model):
         return self.name
 
 
+# Lower-cased form used for case-insensitive identifier lookups
+def normalize_identifier(value):
+    return value.strip().lower() if value else None
+
+
 class User(models.Model):
     id = fields.IntField(pk=True)
     username = fields.CharField(max_length=50, unique=True)
     email = fields.CharField(max_length=100, unique=True, null=True)
+    # Kept in sync with username/email by save(); set them yourself with bulk_create
+    username_lower = fields.CharField(max_length=50, unique=True, null=True)
+    email_lower = fields.CharField(max_length=100, unique=True, null=True)
     full_name = fields.CharField(max_length=100, null=True)
     hashed_password = fields.CharField(max_length=128)
     is_active = fields.BooleanField(default=True)
     registration_date = fields.DatetimeField(default=datetime.utcnow)
+    # Bumped whenever data carried in the user's access token changes
+    membership_version = fields.IntField(default=0)
+    # Written in batches by app.activity, so they may lag by up to ACTIVITY_FLUSH_SECONDS.
+    # Indexed by app.migrations.ADDED_INDEXES
+    last_login = fields.DatetimeField(null=True)
+    last_seen = fields.DatetimeField(null=True)
     groups: fields.ManyToManyRelation[Group]
 
     def __str__(self):
         return self.username
 
+    async def save(self, *args, **kwargs):
+        self.username_lower = normalize_identifier(self.username)
+        self.email_lower = normalize_identifier(self.email)
+        await super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = (
+            ("username", "id"),
+            ("is_active", "registration_date"),
+            ("registration_date",),
+        )
+
     class PydanticMeta:
-        exclude = ['hashed_password']
+        exclude = ['hashed_password', 'membership_version', 'username_lower', 'email_lower']
+
+
+class RefreshToken(models.Model):
+    id = fields.IntField(pk=True)
+    user: fields.ForeignKeyRelation[User] = fields.ForeignKeyField(
+        "models.User", related_name="refresh_tokens", on_delete=fields.CASCADE
+    )
+    # SHA-256 of the opaque token; the token itself is never stored
+    token_hash = fields.CharField(max_length=64, unique=True)
+    # Every token rotated from the same login shares a family
+    family_id = fields.CharField(max_length=32, index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    expires_at = fields.DatetimeField(index=True)
+    revoked_at = fields.DatetimeField(null=True)
+
+
+class GroupPermission(models.Model):
+    id = fields.IntField(pk=True)
+    group: fields.ForeignKeyRelation[Group] = fields.ForeignKeyField(
+        "models.Group", related_name="permissions", on_delete=fields.CASCADE
+    )
+    # One of the names in app.permissions.PERMISSIONS
+    permission = fields.CharField(max_length=50)
+
+    class Meta:
+        unique_together = (("group", "permission"),)
+
+
+class ApiKey(models.Model):
+    id = fields.IntField(pk=True)
+    user: fields.ForeignKeyRelation[User] = fields.ForeignKeyField(
+        "models.User", related_name="api_keys", on_delete=fields.CASCADE
+    )
+    name = fields.CharField(max_length=100)
+    # Public part of the key, used to find the row; the secret part is only stored as an HMAC
+    prefix = fields.CharField(max_length=16, unique=True)
+    secret_hash = fields.CharField(max_length=64)
+    # Space-separated permission names the key is limited to; empty means all of the user's
+    scopes = fields.CharField(max_length=500, default="")
+    created_at = fields.DatetimeField(auto_now_add=True)
+    expires_at = fields.DatetimeField(null=True)
+    last_used_at = fields.DatetimeField(null=True)
+    revoked_at = fields.DatetimeField(null=True)
+
+
+class AuditEvent(models.Model):
+    id = fields.IntField(pk=True)
+    # When the action happened; rows are inserted later, in batches
+    created_at = fields.DatetimeField()
+    actor = fields.CharField(max_length=50, null=True)
+    action = fields.CharField(max_length=50)
+    target = fields.CharField(max_length=100, null=True)
+    details = fields.JSONField(null=True)
+    request_id = fields.CharField(max_length=128, null=True)
+
+    class Meta:
+        indexes = (
+            ("actor", "id"),
+            ("target", "id"),
+            ("action", "id"),
+            ("created_at",),
+        )
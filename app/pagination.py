@@ -0,0 +1,113 @@
+# app/pagination.py
+
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from tortoise import Tortoise
+from tortoise.expressions import Q
+
+from app import models
+from app.cache import TTLCache
+from app.config import USER_COUNT_MODE, USER_COUNT_CACHE_TTL
+from app.httpcache import bump_data_version
+from app.shared import shared_state
+
+# Total user count, reused for a short while in "cached" and "approximate" modes
+user_count_cache = TTLCache(maxsize=1, ttl=USER_COUNT_CACHE_TTL)
+
+
+# Called after users are created or deleted, here and on every other worker
+def invalidate_user_count():
+    user_count_cache.clear()
+    shared_state.broadcast("user_count")
+    bump_data_version()
+
+
+shared_state.subscribe("user_count", lambda payload: user_count_cache.clear())
+
+
+@dataclass
+class UserPage:
+    users: List[models.User] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+# Cursors are opaque to clients: url-safe base64 of [username, id]
+def encode_cursor(user: models.User) -> str:
+    raw = json.dumps([user.username, user.id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        username, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(username), int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+# Fetch one page of users ordered by (username, id) without OFFSET scans
+async def fetch_user_page(limit: int, after: str = None, before: str = None) -> UserPage:
+    query = models.User.all().prefetch_related("groups")
+    if after:
+        username, user_id = decode_cursor(after)
+        query = query.filter(
+            Q(username__gt=username) | Q(username=username, id__gt=user_id)
+        ).order_by("username", "id")
+    elif before:
+        username, user_id = decode_cursor(before)
+        query = query.filter(
+            Q(username__lt=username) | Q(username=username, id__lt=user_id)
+        ).order_by("-username", "-id")
+    else:
+        query = query.order_by("username", "id")
+
+    users = list(await query.limit(limit + 1))
+    has_more = len(users) > limit
+    users = users[:limit]
+    if before:
+        users.reverse()
+
+    page = UserPage(users=users)
+    if users:
+        if has_more or before:
+            page.next_cursor = encode_cursor(users[-1])
+        if after or (before and has_more):
+            page.prev_cursor = encode_cursor(users[0])
+    return page
+
+
+async def _estimate_user_count() -> Optional[int]:
+    conn = Tortoise.get_connection("default")
+    dialect = conn.capabilities.dialect
+    if dialect == "sqlite":
+        # Highest id handed out so far; over-counts deleted rows but needs no scan
+        _, rows = await conn.execute_query('SELECT MAX(id) AS n FROM "user"')
+        return rows[0]["n"] or 0
+    if dialect == "postgres":
+        _, rows = await conn.execute_query("SELECT reltuples::bigint AS n FROM pg_class WHERE relname = 'user'")
+        if rows and rows[0]["n"] >= 0:
+            return rows[0]["n"]
+    return None
+
+
+# Total number of users and whether the number is an estimate
+async def count_users() -> Tuple[int, bool]:
+    if USER_COUNT_MODE == "exact":
+        return await models.User.all().count(), False
+    cached = user_count_cache.get("users")
+    if cached is not None:
+        return cached
+    result = None
+    if USER_COUNT_MODE == "approximate":
+        estimate = await _estimate_user_count()
+        if estimate is not None:
+            result = (estimate, True)
+    if result is None:
+        result = (await models.User.all().count(), False)
+    user_count_cache.set("users", result)
+    return result
@@ -0,0 +1,121 @@
+# app/permissions.py
+#
+# Role-based access control. Permissions are granted to groups, routes declare
+# what they need with ``Depends(require_permission(...))``, and each principal's
+# effective permissions are compiled into one integer so a check is a bit test.
+
+from typing import Dict, Iterable, List
+
+from fastapi import Depends, HTTPException
+
+from app import models
+from app.cache import TTLCache
+from app.config import PERMISSION_CACHE_TTL
+from app.httpcache import bump_data_version
+from app.shared import shared_state
+from app.user_manager import get_current_user, get_group_names
+
+# Every permission the application checks; a permission's bit is its position here
+PERMISSIONS = (
+    "home:view",
+    "users:read",
+    "users:write",
+    "groups:read",
+    "groups:write",
+    "system:read",
+    "permissions:manage",
+    "audit:read",
+)
+PERMISSION_BITS = {name: 1 << index for index, name in enumerate(PERMISSIONS)}
+ALL_PERMISSIONS = (1 << len(PERMISSIONS)) - 1
+
+# Built-in grants that hold whatever the database says, so administrators can't lock themselves out
+DEFAULT_GRANTS = {
+    "administrators": PERMISSIONS,
+    "managers": ("home:view",),
+}
+
+# Compiled bitset per group name, rebuilt from the database when permissions or groups change
+group_permission_cache = TTLCache(maxsize=1, ttl=PERMISSION_CACHE_TTL)
+
+# Bumped on every rebuild; principals cache their bits against it
+_generation = 0
+
+
+def permission_bits(names: Iterable[str]) -> int:
+    bits = 0
+    for name in names:
+        try:
+            bits |= PERMISSION_BITS[name]
+        except KeyError:
+            raise ValueError(f"Unknown permission: {name}")
+    return bits
+
+
+def permission_names(bits: int) -> List[str]:
+    return [name for name in PERMISSIONS if bits & PERMISSION_BITS[name]]
+
+
+def _drop_group_permissions():
+    group_permission_cache.clear()
+
+
+shared_state.subscribe("permissions", lambda payload: _drop_group_permissions())
+
+
+# Called after grants change or groups are renamed or deleted, here and on every other worker
+def invalidate_permissions():
+    _drop_group_permissions()
+    shared_state.broadcast("permissions")
+    bump_data_version()
+
+
+# Bitset per group name, loaded with one query over the grants table
+async def group_permissions() -> Dict[str, int]:
+    global _generation
+    compiled = group_permission_cache.get("groups")
+    if compiled is not None:
+        return compiled
+    compiled = {name: permission_bits(grants) for name, grants in DEFAULT_GRANTS.items()}
+    rows = await models.GroupPermission.all().values_list("group__name", "permission")
+    for group_name, permission in rows:
+        # Grants for permissions removed from the code are ignored rather than failing every request
+        compiled[group_name] = compiled.get(group_name, 0) | PERMISSION_BITS.get(permission, 0)
+    _generation += 1
+    group_permission_cache.set("groups", compiled)
+    return compiled
+
+
+# Effective permissions of a principal, compiled once and kept on the (cached) object
+async def effective_permissions(user: models.User) -> int:
+    compiled = await group_permissions()
+    cached = getattr(user, "permission_cache", None)
+    if cached is not None and cached[0] == _generation:
+        return cached[1]
+    bits = 0
+    for group_name in await get_group_names(user):
+        bits |= compiled.get(group_name, 0)
+    # Requests made with an API key get at most the key's scopes
+    scopes = getattr(user, "api_key_scopes", None)
+    if scopes is not None:
+        bits &= sum(PERMISSION_BITS.get(name, 0) for name in scopes)
+    user.permission_cache = (_generation, bits)
+    return bits
+
+
+async def has_permission(user: models.User, *names: str) -> bool:
+    required = permission_bits(names)
+    return await effective_permissions(user) & required == required
+
+
+# Dependency for routes: the current user, or 403 unless they hold every listed permission
+def require_permission(*names: str):
+    # Resolved here so a typo fails at import time instead of on the first request
+    required = permission_bits(names)
+
+    async def dependency(current_user: models.User = Depends(get_current_user)) -> models.User:
+        if await effective_permissions(current_user) & required != required:
+            raise HTTPException(status_code=403, detail="Permission denied")
+        return current_user
+
+    return dependency
@@ -0,0 +1,239 @@
+# app/ratelimit.py
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import (
+    LOGIN_RATE_LIMIT_BACKEND,
+    LOGIN_RATE_LIMIT_SQLITE_PATH,
+    LOGIN_RATE_LIMIT_MAX_KEYS,
+    LOGIN_IP_BURST,
+    LOGIN_IP_PER_MINUTE,
+    LOGIN_IDENTIFIER_BURST,
+    LOGIN_IDENTIFIER_PER_MINUTE,
+    LOGIN_LOCKOUT_THRESHOLD,
+    LOGIN_LOCKOUT_BASE_SECONDS,
+    LOGIN_LOCKOUT_MAX_SECONDS,
+)
+
+
+# Refill a token bucket and try to take one token.
+# Returns the new (tokens, retry_after); retry_after is 0 when the token was granted.
+def _take_token(tokens: float, updated: float, capacity: float, per_second: float, now: float) -> Tuple[float, float]:
+    tokens = min(capacity, tokens + (now - updated) * per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / per_second if per_second > 0 else float("inf")
+
+
+# Lockout length after ``failures`` consecutive failures: doubles past the threshold
+def _lockout_seconds(failures: int, threshold: int, base: float, cap: float) -> float:
+    if threshold <= 0 or failures < threshold:
+        return 0.0
+    return min(cap, base * 2 ** (failures - threshold))
+
+
+class MemoryLimiterBackend:
+    """Per-process limiter state; old keys are evicted once ``max_keys`` is reached."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._failures: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def _remember(self, store: OrderedDict, key: str, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_keys:
+            store.popitem(last=False)
+
+    async def take(self, key: str, capacity: float, per_second: float, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens, retry_after = _take_token(tokens, updated, capacity, per_second, now)
+        self._remember(self._buckets, key, (tokens, now))
+        return retry_after
+
+    async def locked_until(self, key: str) -> float:
+        return self._failures.get(key, (0, 0.0))[1]
+
+    async def record_failure(self, key: str, now: float, threshold: int, base: float, cap: float) -> float:
+        failures = self._failures.get(key, (0, 0.0))[0] + 1
+        locked_until = now + _lockout_seconds(failures, threshold, base, cap)
+        self._remember(self._failures, key, (failures, locked_until))
+        return locked_until
+
+    async def clear_failures(self, key: str):
+        self._failures.pop(key, None)
+
+
+class SQLiteLimiterBackend:
+    """Limiter state in a local SQLite file, shared by every worker on the host.
+
+    Every ``sweep_seconds`` a write also deletes buckets idle for ``refill_seconds``
+    (long enough to be full again), failure counts whose lockout lapsed
+    ``failure_seconds`` ago, and the oldest rows beyond ``max_keys`` per table, so
+    random usernames can't grow the file without bound.
+    """
+
+    def __init__(self, path: str, max_keys: int = 100_000, refill_seconds: float = 3600.0,
+                 failure_seconds: float = 3600.0, sweep_seconds: float = 60.0):
+        self.max_keys = max_keys
+        self.refill_seconds = refill_seconds
+        self.failure_seconds = failure_seconds
+        self.sweep_seconds = sweep_seconds
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS login_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS login_failures (key TEXT PRIMARY KEY, failures INT NOT NULL, locked_until REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS login_buckets_updated ON login_buckets (updated);
+            CREATE INDEX IF NOT EXISTS login_failures_locked_until ON login_failures (locked_until);
+        """)
+        self._next_sweep = 0.0
+        self.swept = 0
+
+    # Runs inside a write transaction; a deleted row reads back as a full bucket or no failures
+    def _sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_seconds
+        deleted = self._conn.execute(
+            "DELETE FROM login_buckets WHERE updated < ?", (now - self.refill_seconds,)
+        ).rowcount
+        deleted += self._conn.execute(
+            "DELETE FROM login_failures WHERE locked_until < ?", (now - self.failure_seconds,)
+        ).rowcount
+        # Past the cap, the least recently touched rows go first, as in the memory backend
+        deleted += self._conn.execute(
+            "DELETE FROM login_buckets WHERE key IN "
+            "(SELECT key FROM login_buckets ORDER BY updated DESC LIMIT -1 OFFSET ?)", (self.max_keys,)
+        ).rowcount
+        deleted += self._conn.execute(
+            "DELETE FROM login_failures WHERE key IN "
+            "(SELECT key FROM login_failures ORDER BY locked_until DESC LIMIT -1 OFFSET ?)", (self.max_keys,)
+        ).rowcount
+        self.swept += deleted
+
+    def _transaction(self, func, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _take(self, key, capacity, per_second, now):
+        self._sweep(now)
+        row = self._conn.execute("SELECT tokens, updated FROM login_buckets WHERE key = ?", (key,)).fetchone()
+        tokens, updated = row if row else (capacity, now)
+        tokens, retry_after = _take_token(tokens, updated, capacity, per_second, now)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO login_buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now)
+        )
+        return retry_after
+
+    def _record_failure(self, key, now, threshold, base, cap):
+        self._sweep(now)
+        row = self._conn.execute("SELECT failures FROM login_failures WHERE key = ?", (key,)).fetchone()
+        failures = (row[0] if row else 0) + 1
+        locked_until = now + _lockout_seconds(failures, threshold, base, cap)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO login_failures (key, failures, locked_until) VALUES (?, ?, ?)",
+            (key, failures, locked_until),
+        )
+        return locked_until
+
+    def _locked_until(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT locked_until FROM login_failures WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def _clear_failures(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM login_failures WHERE key = ?", (key,))
+
+    async def take(self, key: str, capacity: float, per_second: float, now: float) -> float:
+        return await asyncio.to_thread(self._transaction, self._take, key, capacity, per_second, now)
+
+    async def locked_until(self, key: str) -> float:
+        return await asyncio.to_thread(self._locked_until, key)
+
+    async def record_failure(self, key: str, now: float, threshold: int, base: float, cap: float) -> float:
+        return await asyncio.to_thread(self._transaction, self._record_failure, key, now, threshold, base, cap)
+
+    async def clear_failures(self, key: str):
+        await asyncio.to_thread(self._clear_failures, key)
+
+
+class LoginLimiter:
+    """Token buckets per client IP and per login identifier, plus lockouts that
+    double with each consecutive failure for the same identifier."""
+
+    def __init__(self, backend, ip_burst: float = LOGIN_IP_BURST, ip_per_minute: float = LOGIN_IP_PER_MINUTE,
+                 identifier_burst: float = LOGIN_IDENTIFIER_BURST,
+                 identifier_per_minute: float = LOGIN_IDENTIFIER_PER_MINUTE,
+                 lockout_threshold: int = LOGIN_LOCKOUT_THRESHOLD,
+                 lockout_base: float = LOGIN_LOCKOUT_BASE_SECONDS,
+                 lockout_max: float = LOGIN_LOCKOUT_MAX_SECONDS):
+        self.backend = backend
+        self.ip_burst = ip_burst
+        self.ip_rate = ip_per_minute / 60
+        self.identifier_burst = identifier_burst
+        self.identifier_rate = identifier_per_minute / 60
+        self.lockout_threshold = lockout_threshold
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.rejected = 0
+
+    # Seconds the caller must wait before trying again; 0 means go ahead
+    async def check(self, ip: Optional[str], identifier: str) -> float:
+        now = time.time()
+        identifier_key = f"id:{identifier}"
+        locked_until = await self.backend.locked_until(identifier_key)
+        if locked_until > now:
+            self.rejected += 1
+            return locked_until - now
+        if ip:
+            retry_after = await self.backend.take(f"ip:{ip}", self.ip_burst, self.ip_rate, now)
+            if retry_after:
+                self.rejected += 1
+                return retry_after
+        retry_after = await self.backend.take(identifier_key, self.identifier_burst, self.identifier_rate, now)
+        if retry_after:
+            self.rejected += 1
+        return retry_after
+
+    async def failed(self, identifier: str):
+        await self.backend.record_failure(
+            f"id:{identifier}", time.time(), self.lockout_threshold, self.lockout_base, self.lockout_max
+        )
+
+    async def succeeded(self, identifier: str):
+        await self.backend.clear_failures(f"id:{identifier}")
+
+
+def _create_backend():
+    if LOGIN_RATE_LIMIT_BACKEND == "sqlite":
+        # An idle bucket is deleted once even the slowest one would have refilled
+        refill_seconds = max(
+            LOGIN_IP_BURST / (LOGIN_IP_PER_MINUTE / 60) if LOGIN_IP_PER_MINUTE > 0 else float("inf"),
+            LOGIN_IDENTIFIER_BURST / (LOGIN_IDENTIFIER_PER_MINUTE / 60) if LOGIN_IDENTIFIER_PER_MINUTE > 0 else float("inf"),
+        )
+        return SQLiteLimiterBackend(
+            LOGIN_RATE_LIMIT_SQLITE_PATH, LOGIN_RATE_LIMIT_MAX_KEYS, refill_seconds, LOGIN_LOCKOUT_MAX_SECONDS
+        )
+    if LOGIN_RATE_LIMIT_BACKEND == "memory":
+        return MemoryLimiterBackend(LOGIN_RATE_LIMIT_MAX_KEYS)
+    raise ValueError(f"Unknown login rate limit backend: {LOGIN_RATE_LIMIT_BACKEND}")
+
+
+login_limiter = LoginLimiter(_create_backend())
@@ -1,6 +1,6 @@
 # app/schemas.py
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from datetime import datetime
 
@@ -16,8 +16,7 @@ class GroupCreate(GroupBase):
 class Group(GroupBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserBase(BaseModel):
@@ -33,10 +32,58 @@ class User(UserBase):
     id: int
     is_active: bool
     registration_date: datetime
+    last_login: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
     groups: List[Group] = []
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserPage(BaseModel):
+    users: List[User]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: int
+    total_is_estimate: bool = False
+
+
+class UserSearchResults(BaseModel):
+    users: List[User]
+    backend: str
+
+
+class ApiKey(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    scopes: List[str]
+    created_at: datetime
+    expires_at: Optional[datetime] = None
+    last_used_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None
+
+
+class ApiKeyCreated(ApiKey):
+    # The full key; it is not stored and can't be shown again
+    key: str
+
+
+class AuditEvent(BaseModel):
+    id: int
+    created_at: datetime
+    actor: Optional[str] = None
+    action: str
+    target: Optional[str] = None
+    details: Optional[dict] = None
+    request_id: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AuditPage(BaseModel):
+    events: List[AuditEvent]
+    next_before_id: Optional[int] = None
+    writer: dict
 
 
 class Token(BaseModel):
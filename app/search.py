@@ -0,0 +1,148 @@
+# app/search.py
+
+import re
+from typing import AsyncIterator, List, Optional
+
+from tortoise import Tortoise
+from tortoise.expressions import Q
+
+from app import models
+from app.cache import TTLCache
+from app.config import SEARCH_CACHE_TTL
+
+# Full-text index over username, email and full_name, created by app.migrations
+FTS_TABLE = "user_search"
+TRIGRAM_INDEX = "idx_user_search_trgm"
+# Expression covered by the Postgres trigram index; queries must use it verbatim
+TRIGRAM_EXPRESSION = """(lower("username") || ' ' || lower(coalesce("email", '')) || ' ' || lower(coalesce("full_name", '')))"""
+
+# Matching user ids per (query, filters); absorbs the repeated requests of as-you-type search
+search_cache = TTLCache(maxsize=256, ttl=SEARCH_CACHE_TTL)
+
+_backend: Optional[str] = None
+
+
+# "fts5", "trigram" or "prefix", depending on which index the database has
+async def search_backend() -> str:
+    global _backend
+    if _backend is None:
+        conn = Tortoise.get_connection("default")
+        dialect = conn.capabilities.dialect
+        _backend = "prefix"
+        if dialect == "sqlite":
+            _, rows = await conn.execute_query(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [FTS_TABLE]
+            )
+            if rows:
+                _backend = "fts5"
+        elif dialect == "postgres":
+            _, rows = await conn.execute_query("SELECT 1 FROM pg_indexes WHERE indexname = $1", [TRIGRAM_INDEX])
+            if rows:
+                _backend = "trigram"
+    return _backend
+
+
+# Smallest string greater than every string starting with ``prefix``
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _fts_query(q: str) -> Optional[str]:
+    # Every word must match the start of a word in some column: "jo smi" finds "John Smith"
+    terms = re.findall(r"\w+", q.lower())
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+async def _fts_ids(q: str, group_id: Optional[int], is_active: Optional[bool], limit: int) -> List[int]:
+    match = _fts_query(q)
+    if match is None:
+        return []
+    sql = f'SELECT "user"."id" FROM "{FTS_TABLE}" JOIN "user" ON "user"."id" = "{FTS_TABLE}"."rowid" ' \
+          f'WHERE "{FTS_TABLE}" MATCH ?'
+    values = [match]
+    if group_id is not None:
+        sql += ' AND "user"."id" IN (SELECT "user_id" FROM "user_group" WHERE "group_id" = ?)'
+        values.append(group_id)
+    if is_active is not None:
+        sql += ' AND "user"."is_active" = ?'
+        values.append(int(is_active))
+    # No ORDER BY: ranking would visit every match, and a short prefix can match millions
+    sql += " LIMIT ?"
+    values.append(limit)
+    _, rows = await Tortoise.get_connection("default").execute_query(sql, values)
+    return [row["id"] for row in rows]
+
+
+async def _trigram_ids(q: str, group_id: Optional[int], is_active: Optional[bool], limit: int) -> List[int]:
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", q.lower()) + "%"
+    sql = f'SELECT "id" FROM "user" WHERE {TRIGRAM_EXPRESSION} LIKE $1'
+    values = [pattern]
+    if group_id is not None:
+        values.append(group_id)
+        sql += f' AND "id" IN (SELECT "user_id" FROM "user_group" WHERE "group_id" = ${len(values)})'
+    if is_active is not None:
+        values.append(is_active)
+        sql += f' AND "is_active" = ${len(values)}'
+    values.append(limit)
+    sql += f" LIMIT ${len(values)}"
+    _, rows = await Tortoise.get_connection("default").execute_query(sql, values)
+    return [row["id"] for row in rows]
+
+
+async def _prefix_ids(q: str, group_id: Optional[int], is_active: Optional[bool], limit: int) -> List[int]:
+    # Range scans on the indexed lower-cased columns; full_name has no index, so it is
+    # only searched through the full-text backends
+    prefix = models.normalize_identifier(q)
+    upper = _prefix_upper_bound(prefix)
+    query = models.User.filter(
+        Q(username_lower__gte=prefix, username_lower__lt=upper) | Q(email_lower__gte=prefix, email_lower__lt=upper)
+    )
+    if group_id is not None:
+        query = query.filter(groups__id=group_id)
+    if is_active is not None:
+        query = query.filter(is_active=is_active)
+    # Unordered like the other backends; sorting every match of a short prefix would be a full scan
+    return list(await query.limit(limit).values_list("id", flat=True))
+
+
+_SEARCHERS = {"fts5": _fts_ids, "trigram": _trigram_ids, "prefix": _prefix_ids}
+
+
+# Ids of up to ``limit`` users matching ``q``, optionally restricted to a group and active state
+async def search_user_ids(q: str, group: Optional[str] = None, is_active: Optional[bool] = None,
+                          limit: int = 20) -> List[int]:
+    q = q.strip()
+    if not q:
+        return []
+    key = (q.lower(), group, is_active, limit)
+    ids = search_cache.get(key)
+    if ids is not None:
+        return ids
+    group_id = None
+    if group:
+        group_ids = await models.Group.filter(name=group).values_list("id", flat=True)
+        if not group_ids:
+            return []
+        group_id = group_ids[0]
+    ids = await _SEARCHERS[await search_backend()](q, group_id, is_active, limit)
+    search_cache.set(key, ids)
+    return ids
+
+
+async def _load_users(ids: List[int]) -> List[models.User]:
+    users = await models.User.filter(id__in=ids).prefetch_related("groups")
+    return sorted(users, key=lambda user: user.username.lower())
+
+
+async def search_users(q: str, group: Optional[str] = None, is_active: Optional[bool] = None,
+                       limit: int = 20) -> List[models.User]:
+    return await _load_users(await search_user_ids(q, group, is_active, limit))
+
+
+# Yield matches batch by batch, so large result sets start arriving immediately
+async def iter_search_users(q: str, group: Optional[str] = None, is_active: Optional[bool] = None,
+                            limit: int = 1000, batch_size: int = 100) -> AsyncIterator[models.User]:
+    ids = await search_user_ids(q, group, is_active, limit)
+    for start in range(0, len(ids), batch_size):
+        for user in await _load_users(ids[start:start + batch_size]):
+            yield user
@@ -0,0 +1,96 @@
+# app/sessions.py
+
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from app.config import REFRESH_TOKEN_EXPIRE_DAYS, REFRESH_TOKEN_REUSE_GRACE_SECONDS
+from app.models import RefreshToken, User
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_token(raw_token: str) -> str:
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+# Create a refresh token for the user; returns the raw value for the cookie
+async def issue_refresh_token(user: User, family_id: str = None) -> str:
+    raw_token = secrets.token_urlsafe(32)
+    await RefreshToken.create(
+        user=user,
+        token_hash=_hash_token(raw_token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=timezone.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return raw_token
+
+
+# A token rotated moments ago, whose family still has a live successor. Browsers
+# send several requests at once when the access token expires, all with the same
+# refresh cookie; only the first rotates it, and the rest must not count as reuse.
+async def _recently_rotated(token: RefreshToken, now) -> bool:
+    if token.revoked_at is None or now - token.revoked_at > timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE_SECONDS):
+        return False
+    # Logout revokes the whole family, so there is no successor to find
+    return await RefreshToken.filter(
+        family_id=token.family_id, revoked_at__isnull=True, expires_at__gt=now
+    ).exists()
+
+
+# Exchange a refresh token for a new one from the same family.
+# Presenting a token that was already rotated revokes the whole family, unless it
+# was rotated within the grace window: then the user is returned without a new
+# token, and the caller keeps the refresh cookie the first request set.
+async def rotate_refresh_token(raw_token: str) -> Optional[Tuple[User, Optional[str]]]:
+    token = await RefreshToken.get_or_none(token_hash=_hash_token(raw_token)).select_related("user")
+    if token is None:
+        return None
+    now = timezone.now()
+    if token.revoked_at is not None:
+        if await _recently_rotated(token, now):
+            return token.user, None
+        logger.warning("Revoked refresh token presented for user: %s", token.user.username)
+        await revoke_family(token.family_id)
+        return None
+    if token.expires_at <= now:
+        return None
+    async with in_transaction():
+        # The conditional update lets exactly one of several concurrent requests rotate the token
+        claimed = await RefreshToken.filter(id=token.id, revoked_at__isnull=True).update(revoked_at=now)
+        if claimed:
+            new_token = await issue_refresh_token(token.user, token.family_id)
+    if claimed:
+        return token.user, new_token
+    await token.refresh_from_db(fields=["revoked_at"])
+    if await _recently_rotated(token, now):
+        return token.user, None
+    logger.warning("Refresh token reuse detected for user: %s", token.user.username)
+    await revoke_family(token.family_id)
+    return None
+
+
+async def revoke_family(family_id: str):
+    await RefreshToken.filter(family_id=family_id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+
+# Revoke the session a refresh token belongs to, e.g. on logout
+async def revoke_refresh_token(raw_token: str):
+    token = await RefreshToken.get_or_none(token_hash=_hash_token(raw_token))
+    if token is not None:
+        await revoke_family(token.family_id)
+
+
+async def revoke_user_tokens(user_id: int):
+    await RefreshToken.filter(user_id=user_id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+
+# Drop tokens that can no longer be used
+async def purge_expired_refresh_tokens() -> int:
+    return await RefreshToken.filter(expires_at__lte=timezone.now()).delete()
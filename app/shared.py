@@ -0,0 +1,411 @@
+# app/shared.py
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import (
+    SHARED_STATE_BACKEND,
+    SHARED_STATE_SQLITE_PATH,
+    SHARED_STATE_REDIS_URL,
+    SHARED_STATE_POLL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Broadcast events are kept this long, so a worker paused for less can still catch up
+EVENT_RETENTION_SECONDS = 600
+COMPACT_INTERVAL_SECONDS = 60
+
+
+class MemorySharedBackend:
+    """State for a single process: revocations live in memory and there are no peers to notify."""
+
+    broadcasts = False
+
+    def __init__(self):
+        self._revoked: Dict[str, Tuple[float, float]] = {}
+
+    async def revoke(self, key: str, value: float, expires_at: float):
+        self._revoked[key] = (value, expires_at)
+
+    async def revocations(self, now: float) -> Dict[str, Tuple[float, float]]:
+        return {key: entry for key, entry in self._revoked.items() if entry[1] > now}
+
+    async def compact(self, now: float):
+        for key in [key for key, (_, expires_at) in self._revoked.items() if expires_at <= now]:
+            del self._revoked[key]
+
+    async def publish(self, events: List[dict]):
+        pass
+
+    async def latest_cursor(self):
+        return None
+
+    async def poll(self, cursor):
+        return cursor, []
+
+
+class SQLiteSharedBackend:
+    """Revocations and an event log in a local SQLite file, shared by every worker on the host."""
+
+    broadcasts = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS revocations (key TEXT PRIMARY KEY, value REAL NOT NULL, expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, body TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS shared_values (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _executemany(self, sql: str, rows: list):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(sql, rows)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    async def revoke(self, key: str, value: float, expires_at: float):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO revocations (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+
+    async def revocations(self, now: float) -> Dict[str, Tuple[float, float]]:
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT key, value, expires_at FROM revocations WHERE expires_at > ?", (now,)
+        )
+        return {key: (value, expires_at) for key, value, expires_at in rows}
+
+    async def compact(self, now: float):
+        await asyncio.to_thread(self._execute, "DELETE FROM revocations WHERE expires_at <= ?", (now,))
+        await asyncio.to_thread(self._execute, "DELETE FROM events WHERE created < ?", (now - EVENT_RETENTION_SECONDS,))
+
+    async def publish(self, events: List[dict]):
+        now = time.time()
+        await asyncio.to_thread(
+            self._executemany, "INSERT INTO events (created, body) VALUES (?, ?)",
+            [(now, json.dumps(event)) for event in events],
+        )
+
+    async def set_values(self, values: Dict[str, str]):
+        await asyncio.to_thread(
+            self._executemany, "INSERT OR REPLACE INTO shared_values (key, value) VALUES (?, ?)", list(values.items())
+        )
+
+    # The stored value, after storing ``value`` if there was none
+    async def setdefault_value(self, key: str, value: str) -> str:
+        await asyncio.to_thread(
+            self._execute, "INSERT OR IGNORE INTO shared_values (key, value) VALUES (?, ?)", (key, value)
+        )
+        rows = await asyncio.to_thread(self._execute, "SELECT value FROM shared_values WHERE key = ?", (key,))
+        return rows[0][0]
+
+    async def latest_cursor(self):
+        rows = await asyncio.to_thread(self._execute, "SELECT COALESCE(MAX(id), 0) FROM events")
+        return rows[0][0]
+
+    async def poll(self, cursor):
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT id, body FROM events WHERE id > ? ORDER BY id", (cursor,)
+        )
+        if not rows:
+            return cursor, []
+        return rows[-1][0], [json.loads(body) for _, body in rows]
+
+
+class RedisSharedBackend:
+    """Revocations in a Redis hash and events in a capped Redis stream, shared across hosts.
+
+    ``client`` is a ``redis.asyncio.Redis`` created with ``decode_responses=True``,
+    or anything implementing the same commands, such as :class:`FakeRedis`.
+    """
+
+    broadcasts = True
+
+    def __init__(self, client, prefix: str = "fastapi-auth", max_events: int = 10_000):
+        self.client = client
+        self.revoked_key = f"{prefix}:revoked"
+        self.events_key = f"{prefix}:events"
+        self.values_key = f"{prefix}:values"
+        self.max_events = max_events
+
+    async def revoke(self, key: str, value: float, expires_at: float):
+        await self.client.hset(self.revoked_key, key, f"{value}:{expires_at}")
+
+    async def revocations(self, now: float) -> Dict[str, Tuple[float, float]]:
+        entries = {}
+        for key, raw in (await self.client.hgetall(self.revoked_key)).items():
+            value, _, expires_at = raw.partition(":")
+            if float(expires_at) > now:
+                entries[key] = (float(value), float(expires_at))
+        return entries
+
+    async def compact(self, now: float):
+        entries = await self.client.hgetall(self.revoked_key)
+        expired = [key for key, raw in entries.items() if float(raw.rpartition(":")[2]) <= now]
+        if expired:
+            await self.client.hdel(self.revoked_key, *expired)
+
+    async def publish(self, events: List[dict]):
+        for event in events:
+            await self.client.xadd(
+                self.events_key, {"body": json.dumps(event)}, maxlen=self.max_events, approximate=True
+            )
+
+    async def set_values(self, values: Dict[str, str]):
+        for key, value in values.items():
+            await self.client.hset(self.values_key, key, value)
+
+    async def setdefault_value(self, key: str, value: str) -> str:
+        await self.client.hsetnx(self.values_key, key, value)
+        return await self.client.hget(self.values_key, key)
+
+    async def latest_cursor(self):
+        last = await self.client.xrevrange(self.events_key, count=1)
+        return last[0][0] if last else "0-0"
+
+    async def poll(self, cursor):
+        response = await self.client.xread({self.events_key: cursor}, count=1000)
+        if not response:
+            return cursor, []
+        entries = response[0][1]
+        return entries[-1][0], [json.loads(fields["body"]) for _, fields in entries]
+
+
+class FakeRedis:
+    """In-process stand-in for the few Redis commands RedisSharedBackend uses.
+
+    Select it with ``SHARED_STATE_REDIS_URL=memory://`` to exercise the Redis code
+    path without a server; it is not shared between processes.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._streams: Dict[str, List[Tuple[str, dict]]] = {}
+        self._last_id = (0, 0)
+
+    async def hset(self, name: str, key: str, value: str) -> int:
+        fields = self._hashes.setdefault(name, {})
+        created = key not in fields
+        fields[key] = value
+        return int(created)
+
+    async def hsetnx(self, name: str, key: str, value: str) -> int:
+        fields = self._hashes.setdefault(name, {})
+        if key in fields:
+            return 0
+        fields[key] = value
+        return 1
+
+    async def hget(self, name: str, key: str) -> Optional[str]:
+        return self._hashes.get(name, {}).get(key)
+
+    async def hgetall(self, name: str) -> Dict[str, str]:
+        return dict(self._hashes.get(name, {}))
+
+    async def hdel(self, name: str, *keys: str) -> int:
+        fields = self._hashes.get(name, {})
+        return sum(fields.pop(key, None) is not None for key in keys)
+
+    def _next_id(self) -> str:
+        millis = int(time.time() * 1000)
+        seq = self._last_id[1] + 1 if millis <= self._last_id[0] else 0
+        self._last_id = (max(millis, self._last_id[0]), seq)
+        return f"{self._last_id[0]}-{self._last_id[1]}"
+
+    async def xadd(self, name: str, fields: dict, maxlen: Optional[int] = None, approximate: bool = True) -> str:
+        stream = self._streams.setdefault(name, [])
+        entry_id = self._next_id()
+        stream.append((entry_id, dict(fields)))
+        if maxlen is not None and len(stream) > maxlen:
+            del stream[:len(stream) - maxlen]
+        return entry_id
+
+    async def xrevrange(self, name: str, count: Optional[int] = None) -> list:
+        entries = list(reversed(self._streams.get(name, [])))
+        return entries[:count] if count else entries
+
+    async def xread(self, streams: Dict[str, str], count: Optional[int] = None) -> list:
+        def parse(entry_id):
+            millis, _, seq = entry_id.partition("-")
+            return int(millis), int(seq or 0)
+
+        response = []
+        for name, after in streams.items():
+            entries = [entry for entry in self._streams.get(name, []) if parse(entry[0]) > parse(after)]
+            if entries:
+                response.append([name, entries[:count] if count else entries])
+        return response
+
+
+class SharedState:
+    """Token revocations and cache invalidations shared by every worker.
+
+    Each worker mirrors the unexpired revocations in memory, so checking a token
+    costs a dict lookup. Revocations and invalidations made elsewhere arrive through
+    the backend's event log, polled every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, backend, poll_interval: float = SHARED_STATE_POLL_SECONDS):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self._revoked: Dict[str, Tuple[float, float]] = {}
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = {}
+        self._outbox: List[dict] = []
+        self._values: Dict[str, Tuple[Callable[[], str], Callable[[str], None]]] = {}
+        self._value_outbox: Dict[str, str] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._cursor = None
+        self._last_compact = 0.0
+
+    # Register a callback for invalidations of ``kind`` made by other workers
+    def subscribe(self, kind: str, handler: Callable[[dict], None]):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    # Register a value every worker should start from, such as a cache version:
+    # ``start`` stores ``current()`` if the backend has none yet and passes the
+    # stored value to ``adopt``. Changes are written back with ``set_value``.
+    def share_value(self, key: str, current: Callable[[], str], adopt: Callable[[str], None]):
+        self._values[key] = (current, adopt)
+
+    def set_value(self, key: str, value: str):
+        if not self.backend.broadcasts:
+            return
+        self._value_outbox[key] = value
+        self._schedule_flush()
+
+    # Tell the other workers to run their ``kind`` handlers; the caller has already
+    # applied the change locally
+    def broadcast(self, kind: str, **payload):
+        if not self.backend.broadcasts:
+            return
+        self._outbox.append({"origin": self.origin, "kind": kind, "payload": payload})
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet; sent by the next flush
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self.flush())
+
+    async def flush(self):
+        while self._outbox or self._value_outbox:
+            values, self._value_outbox = self._value_outbox, {}
+            if values:
+                try:
+                    await self.backend.set_values(values)
+                except Exception as e:
+                    logger.error("Could not store %s shared values: %s", len(values), e)
+            events, self._outbox = self._outbox, []
+            if events:
+                try:
+                    await self.backend.publish(events)
+                except Exception as e:
+                    logger.error("Could not publish %s shared state events: %s", len(events), e)
+
+    async def revoke(self, key: str, value: float, expires_at: float):
+        self._revoked[key] = (value, expires_at)
+        await self.backend.revoke(key, value, expires_at)
+        self.broadcast("revoke", key=key, value=value, expires_at=expires_at)
+
+    # Whether ``key`` is revoked; with ``issued_at``, only if issued before the revocation's cutoff
+    def is_revoked(self, key: str, issued_at: Optional[float] = None) -> bool:
+        entry = self._revoked.get(key)
+        if entry is None:
+            return False
+        value, expires_at = entry
+        if expires_at <= time.time():
+            return False
+        return issued_at is None or issued_at < value
+
+    def _apply(self, event: dict):
+        if event.get("origin") == self.origin:
+            return
+        kind, payload = event.get("kind"), event.get("payload", {})
+        if kind == "revoke":
+            self._revoked[payload["key"]] = (payload["value"], payload["expires_at"])
+        for handler in self._handlers.get(kind, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error("Shared state handler for %s failed: %s", kind, e)
+
+    async def poll_once(self):
+        self._cursor, events = await self.backend.poll(self._cursor)
+        for event in events:
+            self._apply(event)
+        now = time.time()
+        if now - self._last_compact >= COMPACT_INTERVAL_SECONDS:
+            self._last_compact = now
+            self._revoked = {key: entry for key, entry in self._revoked.items() if entry[1] > now}
+            await self.backend.compact(now)
+
+    async def _poll_forever(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.flush()
+                await self.poll_once()
+            except Exception as e:
+                logger.error("Shared state poll failed: %s", e)
+
+    async def start(self):
+        self._cursor = await self.backend.latest_cursor()
+        self._revoked = await self.backend.revocations(time.time())
+        if self.backend.broadcasts:
+            # After the cursor, so a change stored meanwhile also arrives as an event
+            for key, (current, adopt) in self._values.items():
+                adopt(await self.backend.setdefault_value(key, current()))
+        if self.backend.broadcasts and self.poll_interval > 0:
+            self._poll_task = asyncio.create_task(self._poll_forever())
+
+    async def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        await self.flush()
+
+
+def _create_backend():
+    if SHARED_STATE_BACKEND == "memory":
+        return MemorySharedBackend()
+    if SHARED_STATE_BACKEND == "sqlite":
+        return SQLiteSharedBackend(SHARED_STATE_SQLITE_PATH)
+    if SHARED_STATE_BACKEND == "redis":
+        if SHARED_STATE_REDIS_URL == "memory://":
+            return RedisSharedBackend(FakeRedis())
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("SHARED_STATE_BACKEND=redis requires the redis package: pip install redis")
+        return RedisSharedBackend(redis.asyncio.Redis.from_url(SHARED_STATE_REDIS_URL, decode_responses=True))
+    raise ValueError(f"Unknown shared state backend: {SHARED_STATE_BACKEND}")
+
+
+shared_state = SharedState(_create_backend())
@@ -0,0 +1,36 @@
+# app/stats.py
+
+from typing import Dict
+
+from tortoise import Tortoise
+
+from app.cache import TTLCache
+from app.config import GROUP_STATS_CACHE_TTL
+from app.httpcache import bump_data_version
+from app.shared import shared_state
+
+# Member count per group id, dropped whenever memberships change
+group_stats_cache = TTLCache(maxsize=1, ttl=GROUP_STATS_CACHE_TTL)
+
+
+def invalidate_group_stats():
+    group_stats_cache.clear()
+    shared_state.broadcast("group_stats")
+    bump_data_version()
+
+
+shared_state.subscribe("group_stats", lambda payload: group_stats_cache.clear())
+
+
+# Count members of every group with one GROUP BY over the through table
+async def group_member_counts() -> Dict[int, int]:
+    counts = group_stats_cache.get("counts")
+    if counts is not None:
+        return counts
+    conn = Tortoise.get_connection("default")
+    _, rows = await conn.execute_query(
+        'SELECT "group_id", COUNT(*) AS "members" FROM "user_group" GROUP BY "group_id"'
+    )
+    counts = {row["group_id"]: row["members"] for row in rows}
+    group_stats_cache.set("counts", counts)
+    return counts
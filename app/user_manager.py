@@ -5,33 +5,167 @@ import logging
 from fastapi import HTTPException, Request
 from starlette import status
 
+from app.activity import activity_tracker
+from app.apikeys import authenticate_api_key, is_api_key, key_scopes
+from app.auth import decode_access_token
+from app.cache import TTLCache
 from app.config import (
-    SECRET_KEY,
-    ALGORITHM,
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    TOKEN_GROUP_CLAIMS_ENABLED,
+    TOKEN_VERSION_CACHE_TTL,
 )
+from app.httpcache import bump_data_version
 from app.models import User
+from app.shared import shared_state
 from tortoise.exceptions import DoesNotExist
+from tortoise.expressions import F
 
 logger = logging.getLogger(__name__)
 
+# Authenticated users keyed by username, with their group names attached
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# Current membership_version per username, used to reject stale group claims
+version_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=TOKEN_VERSION_CACHE_TTL)
+
+
+def _drop_principals(usernames=None):
+    if usernames is None:
+        principal_cache.clear()
+        version_cache.clear()
+        return
+    for username in usernames:
+        principal_cache.invalidate(username)
+        version_cache.invalidate(username)
+
+
+# Other workers drop the same principals when this one broadcasts a change
+shared_state.subscribe("principal", lambda payload: _drop_principals(payload.get("usernames")))
+
+
+# Drop one cached principal, or all of them when no username is given, on every worker
+def invalidate_principal(username: str = None):
+    usernames = None if username is None else [username]
+    _drop_principals(usernames)
+    shared_state.broadcast("principal", usernames=usernames)
+
+
+# Names of the groups a user belongs to, served from the principal when loaded
+async def get_group_names(user: User) -> frozenset:
+    group_names = getattr(user, "group_names", None)
+    if group_names is None:
+        group_names = frozenset(group.name for group in await user.groups.all())
+        user.group_names = group_names
+    return group_names
+
+
+# Record that users' groups or token data changed: stale tokens stop validating
+async def membership_changed(usernames):
+    usernames = list(usernames)
+    if not usernames:
+        return
+    await User.filter(username__in=usernames).update(membership_version=F("membership_version") + 1)
+    _drop_principals(usernames)
+    shared_state.broadcast("principal", usernames=usernames)
+    bump_data_version()
+
+
+# Claims describing the user's groups, signed into the access token
+async def build_group_claims(user: User) -> dict:
+    return {
+        "uid": user.id,
+        "name": user.full_name,
+        "groups": sorted(await get_group_names(user)),
+        "ver": user.membership_version,
+    }
+
+
+async def get_membership_version(username: str):
+    version = version_cache.get(username)
+    if version is None:
+        versions = await User.filter(username=username).values_list("membership_version", flat=True)
+        if not versions:
+            return None
+        version = versions[0]
+        version_cache.set(username, version)
+    return version
+
+
+# Build the principal from token claims alone, without loading the user row
+async def principal_from_claims(username: str, payload: dict) -> User:
+    version = await get_membership_version(username)
+    if version is None:
+        raise DoesNotExist(User)
+    if version != payload.get("ver"):
+        logger.warning("Stale token for user: %s", username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token is no longer valid, please log in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = User(id=payload.get("uid"), username=username, full_name=payload.get("name"))
+    user.membership_version = version
+    user.group_names = frozenset(payload["groups"])
+    return user
+
+
+async def load_principal(username: str) -> User:
+    user = principal_cache.get(username)
+    if user is not None:
+        return user
+    user = await User.get(username=username).prefetch_related("groups")
+    user.group_names = frozenset(group.name for group in user.groups)
+    principal_cache.set(username, user)
+    return user
+
+
+# Principal for an API key, limited to the key's scopes
+async def principal_from_api_key(raw_key: str) -> User:
+    key = await authenticate_api_key(raw_key)
+    try:
+        if key is None:
+            raise DoesNotExist(User)
+        principal = await load_principal(key.user.username)
+    except DoesNotExist:
+        logger.warning("Invalid API key presented")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # A copy, so the scopes don't leak onto the cached principal
+    user = User(id=principal.id, username=principal.username, email=principal.email, full_name=principal.full_name)
+    user.membership_version = principal.membership_version
+    user.group_names = principal.group_names
+    user.api_key_scopes = key_scopes(key)
+    user.api_key_id = key.id
+    return user
+
 
 async def get_current_user(request: Request) -> User:
-    token = request.cookies.get("access_token")
+    # Machine clients send an API key or access token in the header; browsers use the cookie
+    token = request.headers.get("authorization") or request.cookies.get("access_token")
     if not token:
-        logger.warning("Access token cookie not found")
+        logger.warning("Access token not found")
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
         # Split the token to remove the "Bearer " prefix
         scheme, token = token.split(" ")
         if scheme.lower() != "bearer":
-            logger.warning(f"Invalid auth scheme: {scheme}")
+            logger.warning("Invalid auth scheme: %s", scheme)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication scheme",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if is_api_key(token):
+            user = await principal_from_api_key(token)
+            logger.debug("Authenticated user: %s (API key)", user.username)
+            activity_tracker.note_seen(user.id)
+            return user
         # Decode the JWT token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username = payload.get("sub")
         if username is None:
             logger.warning("Username not found in token payload")
@@ -40,19 +174,25 @@ async def get_current_user(request: Request) -> User:
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        # Fetch the User instance from the database with groups
-        user = await User.get(username=username).prefetch_related("groups")
-        logger.info(f"Authenticated user: {user.username}")
+        if TOKEN_GROUP_CLAIMS_ENABLED and "groups" in payload:
+            # Authorize from the signed group claims
+            user = await principal_from_claims(username, payload)
+        else:
+            # Fetch the User instance with groups, from the cache when possible
+            user = await load_principal(username)
+        logger.debug("Authenticated user: %s", user.username)
+        # Buffered; written with everyone else's at the next flush
+        activity_tracker.note_seen(user.id)
         return user
     except (jwt.PyJWTError, ValueError) as e:
-        logger.error(f"Error decoding JWT token: {e}")
+        logger.error("Error decoding JWT token: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     except DoesNotExist:
-        logger.error(f"User not found: {username}")
+        logger.error("User not found: %s", username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",